@@ -1,3 +1,6 @@
+import base64
+import io
+import json
 import os
 import sys
 import types
@@ -65,8 +68,10 @@ class AutoInstallMockTest(unittest.TestCase):
         with tempfile.TemporaryDirectory() as tmpdir:
             manifest_path = os.path.join(tmpdir, "installed_libraries.txt")
             with patch.dict(sys.modules, {"pdf2image": fake_pdf2image}):
-                with patch.object(utp, "INSTALLED_LIBS_FILE", manifest_path):
-                    with patch.object(utp, "time") as mock_time:
+                with patch.object(utp, "INSTALLED_LIBS_FILE", manifest_path), \
+                        patch.object(utp, "LATEX_CACHE_DIR", os.path.join(tmpdir, "latex")):
+                    with patch.object(utp, "time") as mock_time, \
+                            patch.object(utp, "_SUBPROCESS_KWARGS", None):
                         mock_time.sleep.return_value = None
                         with patch.object(utp.os, "name", "nt"):
                             with patch.object(utp.subprocess, "STARTUPINFO", DummyStartupInfo):
@@ -87,5 +92,467 @@ class AutoInstallMockTest(unittest.TestCase):
         self.assertEqual(mpm_call["startupinfo"].wShowWindow, utp.subprocess.SW_HIDE)
 
 
+class EscPosRasterTest(unittest.TestCase):
+    def test_raster_header_and_inverted_bits(self):
+        img = Image.new("1", (16, 2), 1)
+        img.putpixel((0, 0), 0)
+        img.putpixel((15, 1), 0)
+
+        raster = utp.pil_to_escpos_raster(img)
+
+        self.assertEqual(raster[:8], b"\x1d\x76\x30\x00\x02\x00\x02\x00")
+        self.assertEqual(raster[8:], bytes([0x80, 0x00, 0x00, 0x01]))
+
+    def test_tall_images_are_split_into_bands(self):
+        img = Image.new("1", (16, 600), 1)
+        img.putpixel((0, 599), 0)
+
+        with patch.object(utp, "RASTER_BAND_ROWS", 256):
+            raster = utp.pil_to_escpos_raster(img)
+
+        self.assertEqual(raster.count(b"\x1d\x76\x30\x00"), 3)
+        self.assertEqual(len(raster), 3 * 8 + 600 * 2)
+        self.assertEqual(raster[-8 - 88 * 2:-88 * 2], b"\x1d\x76\x30\x00\x02\x00\x58\x00")
+        self.assertEqual(raster[-2:], b"\x80\x00")
+
+    def test_row_padding_stays_white(self):
+        img = Image.new("1", (10, 1), 1)
+        img.putpixel((9, 0), 0)
+
+        raster = utp.pil_to_escpos_raster(img)
+
+        self.assertEqual(raster[8:], bytes([0x00, 0x40]))
+
+    def test_raster_without_numpy(self):
+        img = Image.new("1", (16, 1), 0)
+        with patch.object(utp, "np", None):
+            raster = utp.pil_to_escpos_raster(img)
+        self.assertEqual(raster[8:], b"\xff\xff")
+
+
+class WrapTest(unittest.TestCase):
+    def test_wrap_respects_width_and_keeps_words(self):
+        text = "alpha beta gamma delta epsilon zeta eta theta iota kappa"
+        max_px = 200
+        lines = utp._wrap(text, utp.FONT_TEXT, max_px)
+
+        self.assertEqual(" ".join(lines).split(), text.split())
+        self.assertGreater(len(lines), 1)
+        for line in lines:
+            if " " in line:
+                self.assertLessEqual(utp._text_len(line, utp.FONT_TEXT), max_px + 2)
+
+    def test_wrap_empty_text(self):
+        self.assertEqual(utp._wrap("", utp.FONT_TEXT, 100), [""])
+        self.assertEqual(utp._wrap(None, utp.FONT_TEXT, 100), [""])
+
+
+class DitherTest(unittest.TestCase):
+    @unittest.skipIf(utp._numba_kernels() is None, "numba not installed")
+    def test_large_images_use_numba_kernel(self):
+        img = Image.new("L", (200, 100), 128)
+        with patch.object(utp, "DITHER_NUMBA_MIN_PIXELS", 1):
+            dithered = utp._apply_dither(img)
+
+        self.assertEqual(dithered.mode, "1")
+        self.assertEqual(dithered.size, img.size)
+        black = dithered.histogram()[0]
+        self.assertAlmostEqual(black / (200 * 100), 0.5, delta=0.05)
+
+    @unittest.skipIf(utp._numba_kernels() is None, "numba not installed")
+    def test_packed_raster_matches_pil_packing(self):
+        img = Image.new("L", (64, 32), 255)
+        img.paste(0, (8, 4, 40, 20))
+        with patch.object(utp, "DITHER_NUMBA_MIN_PIXELS", 1):
+            fast = utp.pil_to_escpos_raster(img)
+            dithered = utp._apply_dither(img)
+        self.assertEqual(fast, utp.pil_to_escpos_raster(dithered))
+
+    @unittest.skipIf(utp._numba_kernels() is None, "numba not installed")
+    def test_fused_kernel_pads_rows_white(self):
+        gray = utp.np.zeros((3, 10), dtype=utp.np.uint8)
+        packed = utp._numba_kernels()[1](gray)
+        self.assertEqual(packed.shape, (3, 2))
+        self.assertEqual(packed[:, 0].tolist(), [0xFF] * 3)
+        self.assertEqual(packed[:, 1].tolist(), [0xC0] * 3)
+
+    def test_broken_numba_falls_back_to_pil(self):
+        img = Image.new("L", (64, 32), 128)
+        with patch.object(utp, "HAS_NUMBA", True), \
+                patch.object(utp, "_NUMBA_KERNELS", None), \
+                patch.object(utp, "DITHER_NUMBA_MIN_PIXELS", 1), \
+                patch.dict(sys.modules, {"numba": None}):
+            raster = utp.pil_to_escpos_raster(img)
+            self.assertFalse(utp.HAS_NUMBA)
+
+        self.assertEqual(len(raster), 8 + 8 * 32)
+
+    def test_small_images_use_pil(self):
+        img = Image.new("L", (10, 10), 255)
+        dithered = utp._apply_dither(img)
+        self.assertEqual(dithered.mode, "1")
+        self.assertEqual(dithered.histogram()[0], 0)
+
+
+class TrimWhitespaceTest(unittest.TestCase):
+    def _sample(self):
+        img = Image.new("L", (50, 40), 255)
+        img.paste(0, (10, 5, 20, 30))
+        img.putpixel((45, 35), 200)
+        return img
+
+    def test_trim_crops_to_dark_content(self):
+        self.assertEqual(utp._trim_whitespace(self._sample()).size, (10, 25))
+
+    def test_trim_without_numpy_matches(self):
+        with patch.object(utp, "np", None):
+            self.assertEqual(utp._trim_whitespace(self._sample()).size, (10, 25))
+
+    def test_blank_image_is_returned_unchanged(self):
+        img = Image.new("L", (30, 30), 255)
+        self.assertIs(utp._trim_whitespace(img), img)
+
+
+class LatexRenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        utp._invalidate_dep_cache()
+        self.addCleanup(utp._invalidate_dep_cache)
+        memory_cache = patch.object(utp, "_RENDER_CACHE", {})
+        memory_cache.start()
+        self.addCleanup(memory_cache.stop)
+
+    def test_identical_source_is_compiled_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(utp, "LATEX_CACHE_DIR", tmpdir), \
+                    patch.object(utp, "_check_pdflatex", return_value=True), \
+                    patch.object(utp.importlib.util, "find_spec", return_value=object()), \
+                    patch.object(utp, "render_with_pdflatex", return_value=Image.new("L", (100, 40), 0)) as render:
+                first = utp.render_latex_image("x^2", "Title", False)
+                second = utp.render_latex_image("x^2", "Title", False)
+                utp.render_latex_image("x^3", "Title", False)
+
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(first.size, second.size)
+        self.assertEqual(first.info["render_key"], second.info["render_key"])
+
+    def test_disk_cache_is_bounded(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(utp, "LATEX_CACHE_DIR", tmpdir), \
+                    patch.object(utp, "RENDER_DISK_CACHE_SIZE", 2):
+                for mtime, key in enumerate(("a", "b"), start=1):
+                    utp._store_cached_render(key, Image.new("L", (4, 4), 255))
+                    os.utime(os.path.join(tmpdir, "renders", f"{key}.png"), (mtime, mtime))
+                utp._store_cached_render("c", Image.new("L", (4, 4), 255))
+                names = sorted(os.listdir(os.path.join(tmpdir, "renders")))
+
+        self.assertEqual(names, ["b.png", "c.png"])
+
+
+class SaveSettingsTest(unittest.TestCase):
+    def test_failed_write_is_retried(self):
+        real_dump = json.dump
+        failures = [OSError("disk full")]
+
+        def flaky_dump(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return real_dump(*args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "printer_settings.json")
+            with patch.object(utp, "SETTINGS_FILE", path), \
+                    patch.object(utp, "APP_SETTINGS", {"printer_ip": ""}), \
+                    patch.object(utp, "_LAST_SAVED_SETTINGS", None), \
+                    patch.object(utp.json, "dump", side_effect=flaky_dump):
+                self.assertFalse(utp.save_settings({"printer_ip": "10.0.0.5"}))
+                self.assertTrue(utp.save_settings({"printer_ip": "10.0.0.5"}))
+                with patch.object(utp.json, "dump") as dump:
+                    self.assertTrue(utp.save_settings({"printer_ip": "10.0.0.5"}))
+                dump.assert_not_called()
+                with open(path, encoding="utf-8") as f:
+                    saved = json.load(f)
+
+        self.assertEqual(saved, {"printer_ip": "10.0.0.5"})
+
+
+class LatexFormatFallbackTest(unittest.TestCase):
+    def setUp(self):
+        utp._invalidate_dep_cache()
+        self.addCleanup(utp._invalidate_dep_cache)
+
+    def test_format_failure_without_log_retries_plain(self):
+        calls = []
+
+        def fake_run(cmd, cwd=None, timeout=10):
+            calls.append(cmd)
+            if any(arg.startswith("-fmt=") for arg in cmd):
+                return 1, "", "Fatal format file error; I'm stymied"
+            return 0, "", ""
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(utp, "LATEX_CACHE_DIR", tmpdir), \
+                    patch.object(utp, "_run_miktex_command", side_effect=fake_run), \
+                    patch.object(utp, "_pdf_rasterizer", return_value=lambda pdf: Image.new("L", (20, 20), 0)):
+                fmt_path = utp._latex_format_path()
+                open(fmt_path, "wb").close()
+                img = utp.render_with_pdflatex("x^2")
+                fmt_left = os.path.exists(fmt_path)
+
+        self.assertEqual(img.size, (20, 20))
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(any(arg.startswith("-fmt=") for arg in calls[1]))
+        self.assertFalse(fmt_left)
+
+
+    def test_user_error_keeps_format(self):
+        calls = []
+
+        def fake_run(cmd, cwd=None, timeout=10):
+            calls.append(cmd)
+            with open(os.path.join(cwd, "ticket.log"), "w", encoding="utf-8") as f:
+                f.write("! Undefined control sequence.\n")
+            return 1, "", ""
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(utp, "LATEX_CACHE_DIR", tmpdir), \
+                    patch.object(utp, "_run_miktex_command", side_effect=fake_run), \
+                    patch.object(utp, "_pdf_rasterizer", return_value=lambda pdf: Image.new("L", (20, 20), 0)):
+                fmt_path = utp._latex_format_path()
+                open(fmt_path, "wb").close()
+                with self.assertRaises(utp.subprocess.CalledProcessError):
+                    utp.render_with_pdflatex("\\badmacro")
+                fmt_left = os.path.exists(fmt_path)
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(fmt_left)
+
+    def test_format_is_moved_in_once_complete(self):
+        def fake_run(cmd, cwd=None, timeout=10):
+            self.assertNotEqual(cwd, tmpdir)
+            name = cmd[3].split("=", 1)[1]
+            open(os.path.join(cwd, f"{name}.fmt"), "wb").close()
+            return 0, "", ""
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.object(utp, "LATEX_CACHE_DIR", tmpdir), \
+                    patch.object(utp, "_run_miktex_command", side_effect=fake_run):
+                fmt_path = utp._build_latex_format()
+                names = os.listdir(tmpdir)
+
+        self.assertEqual(names, [os.path.basename(fmt_path)])
+
+
+class PdfRasterizerTest(unittest.TestCase):
+    def setUp(self):
+        utp._invalidate_dep_cache()
+        self.addCleanup(utp._invalidate_dep_cache)
+
+    def test_unrelated_fitz_module_falls_back_to_pdf2image(self):
+        page = Image.new("L", (8, 8), 0)
+        pdf2image = types.SimpleNamespace(convert_from_path=lambda *args, **kwargs: [page])
+        with patch.dict(sys.modules, {"pymupdf": None, "fitz": types.ModuleType("fitz"), "pdf2image": pdf2image}):
+            rasterize = utp._pdf_rasterizer()
+            self.assertIs(rasterize("ticket.pdf"), page)
+
+
+class LanPrinterTest(unittest.TestCase):
+    def setUp(self):
+        self.sockets = []
+
+    def fake_connect(self, addr, timeout=None):
+        sock = types.SimpleNamespace(sent=[], closed=False)
+        sock.sendall = lambda data: sock.sent.append(bytes(data))
+        sock.setsockopt = lambda *args: None
+        sock.close = lambda: setattr(sock, "closed", True)
+        self.sockets.append(sock)
+        return sock
+
+    def test_batch_reuses_one_connection(self):
+        img = Image.new("1", (16, 4), 1)
+        with patch.object(utp.socket, "create_connection", side_effect=self.fake_connect):
+            with utp.LanPrinter("10.0.0.5") as lan:
+                self.assertTrue(lan.send(img, cut=False))
+                self.assertTrue(lan.send(img, cut=True))
+
+        self.assertEqual(len(self.sockets), 1)
+        stream = b"".join(self.sockets[0].sent)
+        self.assertEqual(stream.count(b"\x1b@"), 2)
+        self.assertEqual(stream.count(b"\x1dV\x00"), 1)
+        self.assertTrue(stream.endswith(b"\x1dV\x00"))
+        self.assertTrue(self.sockets[0].closed)
+
+    def test_print_master_batch_cuts_after_last_image_only(self):
+        imgs = [Image.new("1", (16, 4), 1) for _ in range(3)]
+        with patch.dict(utp.APP_SETTINGS, {"printer_ip": "10.0.0.5"}), \
+                patch.object(utp.socket, "create_connection", side_effect=self.fake_connect):
+            self.assertEqual(utp.print_master_batch(imgs), 3)
+
+        self.assertEqual(len(self.sockets), 1)
+        stream = b"".join(self.sockets[0].sent)
+        self.assertEqual(stream.count(b"\x1b@"), 3)
+        self.assertEqual(stream.count(b"\x1dV\x00"), 1)
+
+    def test_idle_timer_is_armed_once_per_batch(self):
+        img = Image.new("1", (16, 4), 1)
+        with patch.object(utp.socket, "create_connection", side_effect=self.fake_connect), \
+                patch.object(utp.threading, "Timer", wraps=utp.threading.Timer) as timer:
+            with utp.LanPrinter("10.0.0.5") as lan:
+                for _ in range(5):
+                    self.assertTrue(lan.send(img, cut=False))
+
+        self.assertEqual(timer.call_count, 1)
+
+    def test_idle_connection_is_closed(self):
+        img = Image.new("1", (16, 4), 1)
+        with patch.object(utp.socket, "create_connection", side_effect=self.fake_connect):
+            lan = utp.LanPrinter("10.0.0.5", idle_timeout=0.05)
+            self.assertTrue(lan.send(img))
+            timer = lan._idle_timer
+            timer.join(1.0)
+
+        self.assertIsNone(lan.sock)
+        self.assertTrue(self.sockets[0].closed)
+
+    def test_without_ip_nothing_is_sent(self):
+        with patch.object(utp.socket, "create_connection") as connect:
+            self.assertFalse(utp.LanPrinter("").send(Image.new("1", (8, 1), 1)))
+        connect.assert_not_called()
+
+
+class FakeMqttClient:
+    instances = []
+
+    def __init__(self, client_id=None):
+        self.client_id = client_id
+        self.published = []
+        self.connected = False
+        self.publish_rc = 0
+        FakeMqttClient.instances.append(self)
+
+    def tls_set(self, cert_reqs=None):
+        pass
+
+    def username_pw_set(self, user, pw):
+        pass
+
+    def connect(self, host, port, keepalive=60):
+        self.connected = True
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.connected = False
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append((topic, payload, qos))
+        return types.SimpleNamespace(rc=self.publish_rc, wait_for_publish=lambda timeout=None: None, is_published=lambda: True)
+
+
+class MqttClientReuseTest(unittest.TestCase):
+    def setUp(self):
+        FakeMqttClient.instances = []
+        fake_client_module = types.SimpleNamespace(Client=FakeMqttClient, MQTT_ERR_SUCCESS=0)
+        fake_mqtt = types.SimpleNamespace(client=fake_client_module)
+        fake_paho = types.SimpleNamespace(mqtt=fake_mqtt)
+        self.modules = patch.dict(sys.modules, {
+            "paho": fake_paho,
+            "paho.mqtt": fake_mqtt,
+            "paho.mqtt.client": fake_client_module,
+        })
+        self.modules.start()
+        self.addCleanup(self.modules.stop)
+        settings = dict(utp.APP_SETTINGS, mqtt_host="broker.local", printer_ip="")
+        self.settings = patch.object(utp, "APP_SETTINGS", settings)
+        self.settings.start()
+        self.addCleanup(self.settings.stop)
+        self.client_state = patch.multiple(utp, _MQTT_CLIENT=None, _MQTT_CLIENT_CONFIG=None, _MQTT_PENDING=[])
+        self.client_state.start()
+        self.addCleanup(self.client_state.stop)
+
+    def test_consecutive_prints_share_one_connection(self):
+        img = Image.new("L", (16, 16), 255)
+        self.assertTrue(utp.send_mqtt_image(img))
+        self.assertTrue(utp.send_mqtt_image(img))
+
+        self.assertEqual(len(FakeMqttClient.instances), 1)
+        self.assertEqual(len(FakeMqttClient.instances[0].published), 2)
+
+    def test_payload_is_json_with_base64_png(self):
+        img = Image.new("L", (16, 16), 255)
+        utp.send_mqtt_image(img, cut=False)
+
+        topic, payload, qos = FakeMqttClient.instances[0].published[0]
+        data = json.loads(payload)
+        self.assertEqual(data["data_type"], "png")
+        self.assertEqual(data["cut_paper"], 0)
+        png = Image.open(io.BytesIO(base64.b64decode(data["data_base64"])))
+        self.assertEqual(png.size, (16, 16))
+
+    def test_publish_does_not_wait_for_ack(self):
+        acked = []
+
+        def publish(client, topic, payload, qos=0):
+            return types.SimpleNamespace(
+                rc=0,
+                wait_for_publish=lambda timeout=None: acked.append(True),
+                is_published=lambda: bool(acked),
+            )
+
+        with patch.object(FakeMqttClient, "publish", publish):
+            self.assertTrue(utp.send_mqtt_image(Image.new("L", (16, 16), 255)))
+        self.assertEqual(acked, [])
+        self.assertTrue(utp.wait_mqtt_publishes(timeout=1.0))
+        self.assertEqual(acked, [True])
+        self.assertEqual(utp._MQTT_PENDING, [])
+
+    def test_reconnect_waits_for_outstanding_tickets(self):
+        acked = []
+
+        def publish(client, topic, payload, qos=0):
+            return types.SimpleNamespace(
+                rc=0,
+                wait_for_publish=lambda timeout=None: acked.append(client.connected),
+                is_published=lambda: bool(acked),
+            )
+
+        with patch.object(FakeMqttClient, "publish", publish):
+            self.assertTrue(utp.send_mqtt_image(Image.new("L", (16, 16), 255)))
+            utp.APP_SETTINGS["mqtt_host"] = "other.local"
+            self.assertTrue(utp.send_manual_cut())
+
+        self.assertEqual(acked, [True])
+
+    def test_failed_publish_drops_client(self):
+        img = Image.new("L", (16, 16), 255)
+        utp.send_mqtt_image(img)
+        FakeMqttClient.instances[0].publish_rc = 4
+        self.assertFalse(utp.send_mqtt_image(img))
+        self.assertFalse(FakeMqttClient.instances[0].connected)
+
+        self.assertTrue(utp.send_mqtt_image(img))
+        self.assertEqual(len(FakeMqttClient.instances), 2)
+
+    def test_manual_cut_uses_shared_client(self):
+        utp.send_mqtt_image(Image.new("L", (16, 16), 255))
+        self.assertTrue(utp.send_manual_cut())
+
+        self.assertEqual(len(FakeMqttClient.instances), 1)
+        topic, payload, qos = FakeMqttClient.instances[0].published[-1]
+        self.assertEqual(json.loads(payload)["data_type"], "cmd")
+
+    def test_settings_change_reconnects(self):
+        img = Image.new("L", (16, 16), 255)
+        utp.send_mqtt_image(img)
+        utp.APP_SETTINGS["mqtt_host"] = "other.local"
+        utp.send_mqtt_image(img)
+
+        self.assertEqual(len(FakeMqttClient.instances), 2)
+        self.assertFalse(FakeMqttClient.instances[0].connected)
+
+
 if __name__ == "__main__":
     unittest.main()
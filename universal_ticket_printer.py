@@ -1,4 +1,7 @@
+import atexit
 import base64
+import enum
+import hashlib
 import io
 import json
 import socket
@@ -18,8 +21,12 @@ import time
 import queue
 import logging
 import logging.handlers
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Optional, Callable, Tuple, Iterable, Set
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List, Optional, Callable, Tuple, Iterable, Set
 
 # --- UI Imports ---
 import tkinter as tk
@@ -28,13 +35,22 @@ from tkinter import filedialog, messagebox
 # --- Dependencies Check ---
 try:
     import customtkinter as ctk
-    from PIL import Image, ImageDraw, ImageFont, ImageTk, ImageOps, ImageChops
+    from PIL import Image, ImageDraw, ImageFont, ImageTk, ImageOps
     import requests
     from packaging import version as packaging_version
 except ImportError:
     ctk = None 
     print("CRITICAL: Missing libraries. Run: pip install customtkinter Pillow requests packaging paho-mqtt pdf2image")
 
+# --- Optional Acceleration ---
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Numba is imported on first use, see _numba_kernels()
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
 # ----------------------------------------------------------------------
 # GLOBAL PATH & SETTINGS MANAGEMENT
 # ----------------------------------------------------------------------
@@ -53,6 +69,9 @@ SETTINGS_FILE = os.path.join(BASE_DIR, "printer_settings.json")
 ICON_FILE = os.path.join(BASE_DIR, "assets", "Thermal-Printer.ico")
 LOG_FILE = os.path.join(BASE_DIR, "printer_debug.log")
 INSTALLED_LIBS_FILE = os.path.join(BASE_DIR, "installed_libraries.txt")
+LATEX_CACHE_DIR = os.path.join(BASE_DIR, ".cache", "latex")
+LATEX_TOOLS_FILE = os.path.join(BASE_DIR, ".cache", "latex_tools.json")
+LATEX_WORK_FILES = ("ticket.tex", "ticket.pdf", "ticket.log")
 
 DEFAULT_SETTINGS = {
     "bulk_delimiter": "::",
@@ -69,6 +88,8 @@ DEFAULT_SETTINGS = {
 }
 
 APP_SETTINGS = {}
+# What save_settings last wrote successfully, lets unchanged saves skip the disk
+_LAST_SAVED_SETTINGS: Optional[dict] = None
 
 MIKTEX_URL = "https://miktex.org/download"
 
@@ -77,6 +98,11 @@ MIKTEX_URL = "https://miktex.org/download"
 LOG_QUEUE: "queue.Queue[logging.LogRecord]" = queue.Queue()
 LOGGER = logging.getLogger("ticket_printer")
 MIKTEX_LOCK = threading.Lock()
+LATEX_RENDER_LOCK = threading.Lock()
+MQTT_LOCK = threading.Lock()
+_MQTT_CLIENT = None
+_MQTT_CLIENT_CONFIG = None
+_MQTT_PENDING: list = []
 
 def _setup_logging() -> logging.handlers.QueueListener:
     LOGGER.setLevel(logging.DEBUG)
@@ -101,16 +127,22 @@ def _log_debug(message: str):
 def _log_error(message: str):
     LOGGER.error(message)
 
+_SUBPROCESS_KWARGS: Optional[dict] = None
+
 def _get_subprocess_kwargs() -> dict:
+    """Hidden-window Popen kwargs on Windows, built once (Popen copies STARTUPINFO itself)."""
+    global _SUBPROCESS_KWARGS
     if os.name != "nt":
         return {}
-    creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
-    startupinfo = None
-    if hasattr(subprocess, "STARTUPINFO"):
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    return {"creationflags": creationflags, "startupinfo": startupinfo}
+    if _SUBPROCESS_KWARGS is None:
+        creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        startupinfo = None
+        if hasattr(subprocess, "STARTUPINFO"):
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            startupinfo.wShowWindow = subprocess.SW_HIDE
+        _SUBPROCESS_KWARGS = {"creationflags": creationflags, "startupinfo": startupinfo}
+    return _SUBPROCESS_KWARGS
 
 REQUIRED_LATEX_PACKAGES = [
     "inputenc",
@@ -201,18 +233,21 @@ def _update_manifest(
         updated_app.update({f"package:{pkg}" for pkg in app_installed})
     _write_manifest(pre_entries, updated_app)
 
+# Fehlende LaTeX-Dateien und TikZ-Bibliotheken in einem einzigen Durchlauf über das Log
+_MISSING_DEP_RE = re.compile(
+    r"! LaTeX Error: File `(?P<package>.+?)\.(?:sty|tfm|fd|cfg|def|cls)' not found"
+    r"|I did not know the library '(?P<tikz>[^']+)'"
+)
+
 def _parse_missing_dependencies(log_text: str) -> Tuple[Optional[str], Optional[str]]:
-    # Wir nutzen r"" (Raw-Strings), damit die Backslashes und Punkte 1:1 übernommen werden
-    # Die Erweiterung sucht nun nach allen relevanten LaTeX-Dateitypen
-    package_match = re.search(r"! LaTeX Error: File `(.+?)\.(?:sty|tfm|fd|cfg|def|cls)' not found", log_text)
-    
-    # Erkennt fehlende TikZ-Bibliotheken
-    tikz_match = re.search(r"I did not know the library '([^']+)'", log_text)
-    
-    return (
-        package_match.group(1) if package_match else None,
-        tikz_match.group(1) if tikz_match else None
-    )
+    found = {"package": None, "tikz": None}
+    for match in _MISSING_DEP_RE.finditer(log_text):
+        kind = match.lastgroup
+        if found[kind] is None:
+            found[kind] = match.group(kind)
+            if found["package"] is not None and found["tikz"] is not None:
+                break
+    return found["package"], found["tikz"]
 
 def _warmup_manifest():
     pre_installed, app_installed = _read_manifest()
@@ -303,11 +338,15 @@ def load_settings():
     return APP_SETTINGS
 
 def save_settings(data):
-    global APP_SETTINGS
+    global APP_SETTINGS, _LAST_SAVED_SETTINGS
     APP_SETTINGS.update(data)
+    # Skip the write only if this exact content already made it to disk
+    if APP_SETTINGS == _LAST_SAVED_SETTINGS and os.path.exists(SETTINGS_FILE):
+        return True
     try:
         with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
             json.dump(APP_SETTINGS, f, indent=4, ensure_ascii=False)
+        _LAST_SAVED_SETTINGS = dict(APP_SETTINGS)
         return True
     except PermissionError:
         try:
@@ -403,16 +442,45 @@ def ensure_base_dir_writable():
 
 PRINTER_PORT = 9100
 LAN_TIMEOUT = 2.0
+LAN_IDLE_TIMEOUT = 10.0
+LAN_CHUNK_SIZE = 64 * 1024
+RASTER_BAND_ROWS = 256
+MQTT_PUBLISH_TIMEOUT = 5.0
+MQTT_PNG_COMPRESS_LEVEL = 1
 PRINT_WIDTH_PX = 576
+PRINTER_DPI = 203
 MARGIN_T, MARGIN_B, MARGIN_L, MARGIN_R = 28, 40, 18, 18
 LINE_HEIGHT_MULT = 1.15
 DITHER_METHOD = "floyd"
+DITHER_NUMBA_MIN_PIXELS = 1_000_000
+TRIM_THRESHOLD = 155
+_INVERT_TBL = bytes(255 - i for i in range(256))
+# Pillow-SIMD is still on the 9.0 API, which predates the Image.Resampling enum
+RESAMPLE_LANCZOS = getattr(Image, "Resampling", Image).LANCZOS
+RESAMPLE_BICUBIC = getattr(Image, "Resampling", Image).BICUBIC
+# Lets resize() shrink by whole factors with reduce() before the final filter pass
+RESIZE_REDUCING_GAP = 2.0
+ZOOM_DEBOUNCE_MS = 80
+ZOOM_CACHE_SIZE = 16
+RENDER_MEMORY_CACHE_SIZE = 16
+RENDER_DISK_CACHE_SIZE = 128
+_RENDER_CACHE: Dict[str, Image.Image] = {}
+_RENDER_CACHE_LOCK = threading.Lock()
+RASTER_CACHE_SIZE = 8
+BULK_RENDER_CACHE_SIZE = 256
+_RASTER_CACHE: Dict[str, bytes] = {}
+_RASTER_CACHE_LOCK = threading.Lock()
+# Shared by bulk/image printing; worker threads are only spawned on first submit
+RENDER_WORKERS = min(8, os.cpu_count() or 1)
+RENDER_POOL = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+BULK_READ_AHEAD = 2 * RENDER_WORKERS
 
 TITLE_SIZE = 36
 TEXT_SIZE = 28
 TIME_SIZE = 24
 
-def _safe_font(candidates: List[str], size: int) -> ImageFont.ImageFont:
+@lru_cache(maxsize=None)
+def _resolve_font_path(candidates: Tuple[str, ...]) -> Optional[str]:
     local_font_dir = os.path.join(BASE_DIR, "assets", "fonts")
     search_paths = []
     if os.path.exists(local_font_dir):
@@ -428,124 +496,256 @@ def _safe_font(candidates: List[str], size: int) -> ImageFont.ImageFont:
     
     for name in search_paths:
         try:
-            return ImageFont.truetype(name, int(size))
+            ImageFont.truetype(name, 10)
+            return name
         except Exception:
             continue
+    return None
+
+@lru_cache(maxsize=None)
+def _safe_font(candidates: Tuple[str, ...], size: int) -> ImageFont.ImageFont:
+    path = _resolve_font_path(candidates)
+    if path:
+        try:
+            return ImageFont.truetype(path, int(size))
+        except Exception:
+            pass
     return ImageFont.load_default()
 
-FONT_NAMES_TITLE = ["DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf", "Segoe UI Bold"]
-FONT_NAMES_TEXT = ["DejaVuSans.ttf", "Arial.ttf", "arial.ttf", "Segoe UI"]
-FONT_NAMES_TIME = ["DejaVuSans.ttf", "Arial.ttf", "arial.ttf", "Consolas"]
+FONT_NAMES_TITLE = ("DejaVuSans-Bold.ttf", "Arial Bold.ttf", "arialbd.ttf", "Segoe UI Bold")
+FONT_NAMES_TEXT = ("DejaVuSans.ttf", "Arial.ttf", "arial.ttf", "Segoe UI")
+FONT_NAMES_TIME = ("DejaVuSans.ttf", "Arial.ttf", "arial.ttf", "Consolas")
 
 FONT_TITLE = _safe_font(FONT_NAMES_TITLE, TITLE_SIZE)
 FONT_TEXT = _safe_font(FONT_NAMES_TEXT, TEXT_SIZE)
 FONT_TIME = _safe_font(FONT_NAMES_TIME, TIME_SIZE)
 
+def _line_height(font: ImageFont.ImageFont) -> int:
+    m = font.getmetrics()
+    return int((m[0] + m[1]) * LINE_HEIGHT_MULT)
+
+# Fonts are fixed for the process lifetime, so their line heights are too
+LH_TITLE = _line_height(FONT_TITLE)
+LH_TEXT = _line_height(FONT_TEXT)
+LH_TIME = _line_height(FONT_TIME)
+
+@lru_cache(maxsize=4096)
 def _text_len(text: str, font: ImageFont.ImageFont) -> int:
     try:
         return int(font.getlength(text))
     except AttributeError:
         return int(font.getbbox(text)[2])
 
-def _wrap(text: str, font: ImageFont.ImageFont, max_px: int) -> List[str]:
-    words = (text or "").split()
-    if not words: return [""]
+@lru_cache(maxsize=1024)
+def _wrap_cached(text: str, font: ImageFont.ImageFont, max_px: int) -> Tuple[str, ...]:
+    words = text.split()
+    if not words: return ("",)
+    space_w = _text_len(" ", font)
     lines: List[str] = []
-    cur = words[0]
-    for w in words[1:]:
-        if _text_len(cur + " " + w, font) <= max_px:
-            cur += " " + w
+    start = 0
+    cur_w = _text_len(words[0], font)
+    for i in range(1, len(words)):
+        w_len = _text_len(words[i], font)
+        if cur_w + space_w + w_len <= max_px:
+            cur_w += space_w + w_len
         else:
-            lines.append(cur)
-            cur = w
-    lines.append(cur)
-    return lines
+            lines.append(" ".join(words[start:i]))
+            start = i
+            cur_w = w_len
+    lines.append(" ".join(words[start:]))
+    return tuple(lines)
+
+def _wrap(text: str, font: ImageFont.ImageFont, max_px: int) -> List[str]:
+    return list(_wrap_cached(text or "", font, int(max_px)))
+
+def _fs_dither_py(gray):
+    """Floyd-Steinberg on a uint8 (h, w) array, returns 0/255 uint8."""
+    h, w = gray.shape
+    out = np.empty((h, w), dtype=np.uint8)
+    cur = np.zeros(w + 2, dtype=np.float32)
+    nxt = np.zeros(w + 2, dtype=np.float32)
+    for y in range(h):
+        for x in range(w):
+            val = gray[y, x] + cur[x + 1]
+            if val < 128.0:
+                out[y, x] = 0
+                err = val
+            else:
+                out[y, x] = 255
+                err = val - 255.0
+            cur[x + 2] += err * 0.4375
+            nxt[x] += err * 0.1875
+            nxt[x + 1] += err * 0.3125
+            nxt[x + 2] += err * 0.0625
+        cur, nxt = nxt, cur
+        nxt[:] = 0.0
+    return out
+
+def _fs_dither_pack_py(gray):
+    """Floyd-Steinberg fused with ESC/POS bit packing, 1 = black, rows padded white."""
+    h, w = gray.shape
+    w_bytes = (w + 7) // 8
+    out = np.zeros((h, w_bytes), dtype=np.uint8)
+    cur = np.zeros(w + 2, dtype=np.float32)
+    nxt = np.zeros(w + 2, dtype=np.float32)
+    for y in range(h):
+        byte = 0
+        for x in range(w):
+            val = gray[y, x] + cur[x + 1]
+            if val < 128.0:
+                byte = (byte << 1) | 1
+                err = val
+            else:
+                byte = byte << 1
+                err = val - 255.0
+            if x & 7 == 7:
+                out[y, x >> 3] = byte
+                byte = 0
+            cur[x + 2] += err * 0.4375
+            nxt[x] += err * 0.1875
+            nxt[x + 1] += err * 0.3125
+            nxt[x + 2] += err * 0.0625
+        if w & 7:
+            out[y, w_bytes - 1] = byte << (8 - (w & 7))
+        cur, nxt = nxt, cur
+        nxt[:] = 0.0
+    return out
+
+_NUMBA_KERNELS = None
+_NUMBA_LOCK = threading.Lock()
+
+def _numba_kernels():
+    """Returns the JIT-compiled (dither, dither_pack) kernels, or None without Numba/NumPy."""
+    global _NUMBA_KERNELS, HAS_NUMBA
+    if not HAS_NUMBA or np is None:
+        return None
+    with _NUMBA_LOCK:
+        if _NUMBA_KERNELS is None and HAS_NUMBA:
+            try:
+                from numba import njit, types
+                # np.asarray() on an "L" image is a read-only C-contiguous uint8 array.
+                # An explicit signature compiles eagerly here instead of on the first print;
+                # nogil lets render pool threads dither side by side
+                sig = types.uint8[:, :](types.Array(types.uint8, 2, "C", readonly=True))
+                _NUMBA_KERNELS = (
+                    njit(sig, cache=True, nogil=True)(_fs_dither_py),
+                    njit(sig, cache=True, nogil=True)(_fs_dither_pack_py),
+                )
+            except Exception as exc:
+                # e.g. a Numba build that doesn't match the installed NumPy, PIL dithers instead
+                _log_debug(f"Numba unavailable, using PIL dithering: {exc}")
+                HAS_NUMBA = False
+    return _NUMBA_KERNELS
+
+def _warmup_numba():
+    """Compiles (or loads from the on-disk cache) the dither kernels ahead of the first big print."""
+    _numba_kernels()
+
+def _use_numba_dither(img: Image.Image) -> bool:
+    if img.mode == "1" or DITHER_METHOD != "floyd" or not HAS_NUMBA or np is None:
+        return False
+    if img.width * img.height < DITHER_NUMBA_MIN_PIXELS:
+        return False
+    return _numba_kernels() is not None
+
+def _dither_to_bits(img: Image.Image):
+    """Numba-dithered bool array (True = black), or None when PIL should dither."""
+    if not _use_numba_dither(img):
+        return None
+    dither, _ = _numba_kernels()
+    return dither(np.asarray(img.convert("L"))) == 0
 
 def _apply_dither(img: Image.Image) -> Image.Image:
+    if img.mode == "1":
+        return img
+    bits = _dither_to_bits(img)
+    if bits is not None:
+        return Image.fromarray(~bits)
     imgL = img.convert("L")
     if DITHER_METHOD == "floyd":
         return imgL.convert("1", dither=Image.FLOYDSTEINBERG)
     return imgL.convert("1")
 
 def _trim_whitespace(img: Image.Image) -> Image.Image:
-    bg = Image.new(img.mode, img.size, 255)
-    diff = ImageChops.difference(img.convert("RGB"), bg.convert("RGB"))
-    diff = ImageChops.add(diff, diff, 2.0, -100)
-    bbox = diff.getbbox()
+    gray = img.convert("L")
+    if np is not None:
+        mask = np.asarray(gray) < TRIM_THRESHOLD
+        rows = np.flatnonzero(mask.any(axis=1))
+        if rows.size == 0:
+            return img
+        cols = np.flatnonzero(mask.any(axis=0))
+        bbox = (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+    else:
+        bbox = gray.point(lambda v: 255 if v < TRIM_THRESHOLD else 0).getbbox()
     if bbox:
         return img.crop(bbox)
     return img
 
-def render_receipt_image(title: str, body_lines: List[str], add_dt: bool = True) -> Image.Image:
+def _ticket_time(add_dt: bool) -> Optional[str]:
+    return datetime.now().strftime("%Y-%m-%d %H:%M") if add_dt else None
+
+def _header_lines(title: str, time_str: Optional[str]) -> Tuple[List[str], Optional[str]]:
     max_w = int(PRINT_WIDTH_PX - MARGIN_L - MARGIN_R)
     wrapped_title = []
     if title and title.strip():
         wrapped_title = _wrap(title.strip(), FONT_TITLE, max_w)
+    return wrapped_title, time_str
+
+def _header_height(wrapped_title: List[str], time_str: Optional[str]) -> int:
+    h = 0
+    if wrapped_title: h += len(wrapped_title) * LH_TITLE + 10
+    if time_str: h += LH_TIME
+    return h
+
+def _compose_header(draw: ImageDraw.ImageDraw, wrapped_title: List[str], time_str: Optional[str], y: int) -> int:
+    """Draws title and timestamp starting at y, returns the y below them."""
+    for ln in wrapped_title:
+        draw.text((int(MARGIN_L), int(y)), ln, fill=0, font=FONT_TITLE)
+        y += LH_TITLE
+    if wrapped_title: y += 10
+    if time_str:
+        draw.text((int(MARGIN_L), int(y)), time_str, fill=0, font=FONT_TIME)
+        y += LH_TIME
+    return y
+
+def render_receipt_image(title: str, body_lines: List[str], add_dt: bool = True) -> Image.Image:
+    return _render_receipt(title, body_lines, _ticket_time(add_dt), "L")
+
+def render_receipt_image_mono(title: str, body_lines: List[str], add_dt: bool = True) -> Image.Image:
+    """Same layout as render_receipt_image, drawn straight into a 1-bit image for printing."""
+    return _render_receipt(title, body_lines, _ticket_time(add_dt), "1")
+
+@lru_cache(maxsize=BULK_RENDER_CACHE_SIZE)
+def _render_bulk_ticket(title: str, body_lines: Tuple[str, ...], time_str: Optional[str]) -> Image.Image:
+    """Cached mono ticket for bulk jobs, duplicate lines within the same minute render once."""
+    return _render_receipt(title, list(body_lines), time_str, "1")
+
+def _render_receipt(title: str, body_lines: List[str], time_str: Optional[str], mode: str) -> Image.Image:
+    max_w = int(PRINT_WIDTH_PX - MARGIN_L - MARGIN_R)
+    wrapped_title, time_str = _header_lines(title, time_str)
     wrapped_body = []
     for line in body_lines:
         wrapped_body.extend(_wrap(line, FONT_TEXT, max_w))
-    time_str = datetime.now().strftime("%Y-%m-%d %H:%M") if add_dt else None
-    
-    def get_lh(font): 
-        m = font.getmetrics()
-        return int((m[0] + m[1]) * LINE_HEIGHT_MULT)
-
-    lh_title = get_lh(FONT_TITLE)
-    lh_text = get_lh(FONT_TEXT)
-    lh_time = get_lh(FONT_TIME)
-
-    h = MARGIN_T
-    if wrapped_title: h += len(wrapped_title) * lh_title + 10
-    if time_str: h += lh_time
-    if wrapped_body: h += len(wrapped_body) * lh_text
+
+    h = MARGIN_T + _header_height(wrapped_title, time_str)
+    if wrapped_body: h += len(wrapped_body) * LH_TEXT
     h += MARGIN_B
     h = max(int(h), 100)
 
-    img = Image.new("L", (int(PRINT_WIDTH_PX), int(h)), 255)
+    img = Image.new(mode, (int(PRINT_WIDTH_PX), int(h)), 255)
     draw = ImageDraw.Draw(img)
-    y = MARGIN_T
-    for ln in wrapped_title:
-        draw.text((int(MARGIN_L), int(y)), ln, fill=0, font=FONT_TITLE)
-        y += lh_title
-    if wrapped_title: y += 10
-    if time_str:
-        draw.text((int(MARGIN_L), int(y)), time_str, fill=0, font=FONT_TIME)
-        y += lh_time
+    y = _compose_header(draw, wrapped_title, time_str, MARGIN_T)
     for ln in wrapped_body:
         draw.text((int(MARGIN_L), int(y)), ln, fill=0, font=FONT_TEXT)
-        y += lh_text
+        y += LH_TEXT
     return img
 
 # ----------------------------------------------------------------------
 # LATEX ENGINE (Updated with Auto-Install)
 # ----------------------------------------------------------------------
-def _check_pdflatex():
-    try:
-        _run_miktex_command(["pdflatex", "--version"], timeout=5)
-        return True
-    except FileNotFoundError:
-        return False
-    except Exception as exc:
-        _log_debug(f"pdflatex check failed: {exc}")
-        return shutil.which("pdflatex") is not None
-
-def render_with_pdflatex(
-    latex_code: str,
-    status_callback: Optional[Callable[[str], None]] = None
-) -> Image.Image:
-    try:
-        from pdf2image import convert_from_path
-    except ImportError:
-        raise RuntimeError("pdf2image library is missing.")
 
-    is_full_doc = "\\begin{document}" in latex_code or "\\section" in latex_code
-    content = latex_code
-    if not is_full_doc:
-        if not ("\\begin{tikzpicture}" in content or "$$" in content or "\\[" in content):
-             content = f"\\[ {content} \\]"
-    
-    # --- TEMPLATE DEFINITION ---
-    tex_template = r"""
+# --- TEMPLATE DEFINITION ---
+LATEX_PREAMBLE = r"""
 \documentclass[11pt]{article}
 \usepackage[utf8]{inputenc}
 \usepackage[T1]{fontenc}
@@ -578,18 +778,214 @@ def render_with_pdflatex(
 \tikzset{wave/.style={decorate, decoration={snake, amplitude=2pt, segment length=5pt, post length=2pt}}}
 
 \pgfplotsset{compat=1.18}
-\geometry{paperwidth=80mm, paperheight=2000mm, left=2mm, right=2mm, top=2mm, bottom=2mm}
+\geometry{paperwidth=%(paperwidth).2fmm, paperheight=2000mm, left=2mm, right=2mm, top=2mm, bottom=2mm}
 \renewcommand{\familydefault}{\sfdefault}
 \setlength{\parindent}{0pt}
 \setlength{\parskip}{0.5em}
-\begin{document}
-%s
-\end{document}
-""" % content
+""" % {
+    # Text block is exactly the printable width at native resolution, so rendered
+    # output fits without resampling
+    "paperwidth": (PRINT_WIDTH_PX - MARGIN_L - MARGIN_R) / PRINTER_DPI * 25.4 + 4,
+}
 
-    temp_dir = tempfile.mkdtemp()
-    
+@lru_cache(maxsize=None)
+def _pdflatex_identity() -> str:
+    """Path and mtime of the pdflatex binary, a TeX update makes old format files unusable."""
+    stamp = _tool_stamp(shutil.which("pdflatex"))
+    return "" if stamp is None else f"{stamp['path']}\x00{stamp['mtime']}"
+
+def _latex_format_name() -> str:
+    raw = LATEX_PREAMBLE + "\x00" + _pdflatex_identity()
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:10]
+    return f"ticket_preamble_{digest}"
+
+def _latex_format_path() -> str:
+    return os.path.join(LATEX_CACHE_DIR, f"{_latex_format_name()}.fmt")
+
+def _build_latex_format() -> Optional[str]:
+    """Dumps LATEX_PREAMBLE into a format file so compiles can skip loading it."""
+    name = _latex_format_name()
+    fmt_path = _latex_format_path()
+    if os.path.exists(fmt_path):
+        return fmt_path
+    os.makedirs(LATEX_CACHE_DIR, exist_ok=True)
+    # Dump into a scratch dir and move the finished file in, renders never see a partial format
+    build_dir = tempfile.mkdtemp(prefix="fmt_build_", dir=LATEX_CACHE_DIR)
+    try:
+        with open(os.path.join(build_dir, f"{name}.tex"), "w", encoding="utf-8") as f:
+            f.write(LATEX_PREAMBLE + "\\begin{document}\n\\end{document}\n")
+        cmd = [
+            "pdflatex", "-ini", "-interaction=nonstopmode", f"-jobname={name}",
+            "&pdflatex", "mylatexformat.ltx", f"{name}.tex"
+        ]
+        exit_code, _, _ = _run_miktex_command(cmd, cwd=build_dir, timeout=180)
+        built = os.path.join(build_dir, f"{name}.fmt")
+        if exit_code != 0 or not os.path.exists(built):
+            _log_debug(f"LaTeX format build failed with exit code {exit_code}")
+            return None
+        os.replace(built, fmt_path)
+    except Exception as exc:
+        _log_debug(f"LaTeX format build failed: {exc}")
+        return None
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    # Formats dumped by an older engine or preamble are never loaded again
+    for old in os.listdir(LATEX_CACHE_DIR):
+        if old.startswith("ticket_preamble_") and not old.startswith(name):
+            try:
+                os.remove(os.path.join(LATEX_CACHE_DIR, old))
+            except OSError:
+                pass
+    return fmt_path
+
+def _discard_latex_format():
+    """Deletes a format file pdflatex refused, so the next warm-up dumps a fresh one."""
+    try:
+        os.remove(_latex_format_path())
+    except OSError:
+        pass
+
+def _prepare_latex_workdir() -> str:
+    """Returns the persistent LaTeX working directory with stale outputs removed."""
+    os.makedirs(LATEX_CACHE_DIR, exist_ok=True)
+    for name in LATEX_WORK_FILES:
+        try:
+            os.remove(os.path.join(LATEX_CACHE_DIR, name))
+        except FileNotFoundError:
+            pass
+    return LATEX_CACHE_DIR
+
+def _cleanup_latex_workdir():
+    for name in LATEX_WORK_FILES:
+        try:
+            os.remove(os.path.join(LATEX_CACHE_DIR, name))
+        except OSError:
+            pass
+
+atexit.register(_cleanup_latex_workdir)
+
+def _tool_stamp(exe: Optional[str]) -> Optional[Dict[str, object]]:
+    if exe is None:
+        return None
+    try:
+        return {"path": exe, "mtime": os.path.getmtime(exe)}
+    except OSError:
+        return None
+
+def _load_tools_cache() -> Dict[str, dict]:
+    try:
+        with open(LATEX_TOOLS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _store_tools_cache(data: Dict[str, dict]) -> None:
+    try:
+        os.makedirs(os.path.dirname(LATEX_TOOLS_FILE), exist_ok=True)
+        with open(LATEX_TOOLS_FILE, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    except OSError as exc:
+        _log_debug(f"Could not write {LATEX_TOOLS_FILE}: {exc}")
+
+def _check_pdflatex():
+    # A pdflatex that passed before and whose executable is unchanged skips the subprocess
+    stamp = _tool_stamp(shutil.which("pdflatex"))
+    tools = _load_tools_cache()
+    if stamp is not None and tools.get("pdflatex") == dict(stamp, ok=True):
+        return True
+    try:
+        _run_miktex_command(["pdflatex", "--version"], timeout=5)
+    except FileNotFoundError:
+        return False
+    except Exception as exc:
+        _log_debug(f"pdflatex check failed: {exc}")
+        return stamp is not None
+    if stamp is not None:
+        tools["pdflatex"] = dict(stamp, ok=True)
+        _store_tools_cache(tools)
+    return True
+
+@lru_cache(maxsize=None)
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+@lru_cache(maxsize=None)
+def _has_pdflatex() -> bool:
+    return _check_pdflatex()
+
+@lru_cache(maxsize=None)
+def _local_poppler_path() -> Optional[str]:
+    """Bundled Poppler next to the executable, if shipped."""
+    local_poppler = os.path.join(BASE_DIR, "poppler", "bin")
+    return local_poppler if os.path.exists(local_poppler) else None
+
+def _invalidate_dep_cache():
+    """Forgets probe results so the next render re-checks installed tools."""
+    _has_module.cache_clear()
+    _pymupdf_module.cache_clear()
+    _has_pdflatex.cache_clear()
+    _pdflatex_identity.cache_clear()
+    _local_poppler_path.cache_clear()
+
+@lru_cache(maxsize=None)
+def _pymupdf_module():
+    """The PyMuPDF module, or None. An unrelated PyPI package also claims the name fitz."""
     try:
+        import pymupdf
+        return pymupdf
+    except ImportError:
+        pass
+    try:
+        # PyMuPDF < 1.24.3 only ships the legacy module name
+        import fitz
+    except ImportError:
+        return None
+    if hasattr(fitz, "open") and hasattr(fitz, "csGRAY"):
+        return fitz
+    _log_debug("Ignoring 'fitz' module, it is not PyMuPDF")
+    return None
+
+def _has_pdf_rasterizer() -> bool:
+    return _pymupdf_module() is not None or _has_module("pdf2image")
+
+def _pdf_rasterizer() -> Callable[[str], Image.Image]:
+    """Returns a function rendering page 1 of a PDF to grayscale, PyMuPDF or pdf2image."""
+    pymupdf = _pymupdf_module()
+    if pymupdf is None:
+        from pdf2image import convert_from_path
+
+        def _poppler(pdf_file: str) -> Image.Image:
+            images = convert_from_path(pdf_file, dpi=PRINTER_DPI, grayscale=True, poppler_path=_local_poppler_path())
+            if not images:
+                raise RuntimeError("Could not convert PDF to image.")
+            return images[0]
+        return _poppler
+
+    def _mupdf(pdf_file: str) -> Image.Image:
+        with pymupdf.open(pdf_file) as doc:
+            pix = doc[0].get_pixmap(dpi=PRINTER_DPI, colorspace=pymupdf.csGRAY, alpha=False)
+        return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    return _mupdf
+
+def render_with_pdflatex(
+    latex_code: str,
+    status_callback: Optional[Callable[[str], None]] = None
+) -> Image.Image:
+    try:
+        rasterize_pdf = _pdf_rasterizer()
+    except ImportError:
+        raise RuntimeError("pdf2image library is missing.")
+
+    is_full_doc = "\\begin{document}" in latex_code or "\\section" in latex_code
+    content = latex_code
+    if not is_full_doc:
+        if not ("\\begin{tikzpicture}" in content or "$$" in content or "\\[" in content):
+             content = f"\\[ {content} \\]"
+    
+    tex_template = LATEX_PREAMBLE + "\\begin{document}\n%s\n\\end{document}\n" % content
+
+    with LATEX_RENDER_LOCK:
+        temp_dir = _prepare_latex_workdir()
         tex_file = os.path.join(temp_dir, "ticket.tex")
         pdf_file = os.path.join(temp_dir, "ticket.pdf")
         
@@ -597,6 +993,10 @@ def render_with_pdflatex(
             f.write(tex_template)
             
         cmd = ["pdflatex", "-interaction=nonstopmode", "ticket.tex"]
+        plain_cmd = cmd
+        # Use the precompiled preamble once the warm-up has built it
+        if os.path.exists(_latex_format_path()):
+            cmd = ["pdflatex", f"-fmt={_latex_format_name()}", "-interaction=nonstopmode", "ticket.tex"]
 
         # --- RETRY LOOP FOR AUTO-INSTALL ---
         max_retries = 4
@@ -609,11 +1009,12 @@ def render_with_pdflatex(
                 break # Success!
             except subprocess.CalledProcessError as e:
                 # If this was the last attempt, fail loudly
-                log_content = "No log found."
+                log_text = None
                 log_path = os.path.join(temp_dir, "ticket.log")
                 if os.path.exists(log_path):
                     with open(log_path, "r", encoding="utf-8", errors="ignore") as log:
-                        log_content = log.read()
+                        log_text = log.read()
+                log_content = log_text if log_text is not None else "No log found."
                 _log_error(f"LaTeX Compilation FAILED.\nFull Log:\n{log_content}")
                 if attempt == max_retries - 1:
                     if isinstance(e.stderr, str):
@@ -623,10 +1024,7 @@ def render_with_pdflatex(
                     raise RuntimeError(f"LaTeX Error (Check logs).\n{log_content[-800:]}\nSTDERR: {err_msg}")
                 
                 # Check for missing package error
-                if os.path.exists(log_path):
-                    with open(log_path, "r", encoding="utf-8", errors="ignore") as log:
-                        log_text = log.read()
-                        
+                if log_text is not None:
                     missing_pkg, missing_tikz = _parse_missing_dependencies(log_text)
                     missing_dep = missing_pkg or missing_tikz
                     if missing_dep:
@@ -646,40 +1044,83 @@ def render_with_pdflatex(
                             _run_miktex_command(["initexmf", "--admin", "--update-fndb"], timeout=180)
                             
                             _track_installed_lib(missing_dep)
+                            _invalidate_dep_cache()
                             _log_debug(f"Installed {missing_dep}. Retrying compilation...")
                             compile_timeout = 180
-                            if attempt < max_retries - 1:
-                                time.sleep(2)
+                            time.sleep(2)
                             continue # Retry the loop
                         except Exception as inst_err:
                             _log_debug(f"Auto-install failed for {missing_dep}: {inst_err}")
                             # Raise immediately if install fails, no point retrying
                             raise RuntimeError(f"Failed to auto-install package '{missing_dep}'.\nError: {inst_err}")
-                    else:
-                        # Not a missing package error, re-raise
-                        raise e
-                else:
-                    raise e
+                if cmd is not plain_cmd and (log_text is None or "Fatal format file error" in log_text):
+                    # pdflatex rejected the format itself (it aborts before writing a log), not the user's code
+                    _log_debug("Precompiled preamble was rejected. Retrying without it...")
+                    _discard_latex_format()
+                    cmd = plain_cmd
+                    continue
+                # Not a missing package error, re-raise
+                raise e
             except FileNotFoundError:
                  raise RuntimeError("LaTeX (pdflatex) not found. Please install MiKTeX or TeX Live.")
-            if attempt < max_retries - 1:
-                time.sleep(2)
 
         # --- IMAGE CONVERSION ---
-        poppler_path = None
-        local_poppler = os.path.join(BASE_DIR, "poppler", "bin")
-        if os.path.exists(local_poppler):
-            poppler_path = local_poppler
-        
-        images = convert_from_path(pdf_file, dpi=203, grayscale=True, poppler_path=poppler_path)
-        if not images:
-            raise RuntimeError("Could not convert PDF to image.")
-        
-        img = _trim_whitespace(images[0])
+        img = _trim_whitespace(rasterize_pdf(pdf_file))
         return img
 
-    finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+def _latex_render_key(latex_code: str, wrapped_title: List[str], time_str: Optional[str]) -> str:
+    raw = "\x00".join([LATEX_PREAMBLE, "\n".join(wrapped_title), time_str or "", latex_code])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+def _remember_render(render_key: str, img: Image.Image):
+    with _RENDER_CACHE_LOCK:
+        _RENDER_CACHE.pop(render_key, None)
+        _RENDER_CACHE[render_key] = img
+        while len(_RENDER_CACHE) > RENDER_MEMORY_CACHE_SIZE:
+            _RENDER_CACHE.pop(next(iter(_RENDER_CACHE)))
+
+def _load_cached_render(render_key: str) -> Optional[Image.Image]:
+    with _RENDER_CACHE_LOCK:
+        img = _RENDER_CACHE.pop(render_key, None)
+        if img is not None:
+            # Re-insert as most recently used
+            _RENDER_CACHE[render_key] = img
+            return img.copy()
+    path = os.path.join(LATEX_CACHE_DIR, "renders", f"{render_key}.png")
+    if not os.path.exists(path):
+        return None
+    try:
+        with Image.open(path) as cached:
+            img = cached.copy()
+        # mtime doubles as the last-use time for disk eviction
+        os.utime(path)
+    except Exception as exc:
+        _log_debug(f"Render cache read failed: {exc}")
+        return None
+    img.info["render_key"] = render_key
+    _remember_render(render_key, img)
+    return img.copy()
+
+def _prune_render_cache(cache_dir: str):
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.name.endswith(".png")]
+        if len(entries) <= RENDER_DISK_CACHE_SIZE:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - RENDER_DISK_CACHE_SIZE]:
+            os.remove(entry.path)
+    except OSError as exc:
+        _log_debug(f"Render cache prune failed: {exc}")
+
+def _store_cached_render(render_key: str, img: Image.Image):
+    _remember_render(render_key, img.copy())
+    try:
+        cache_dir = os.path.join(LATEX_CACHE_DIR, "renders")
+        os.makedirs(cache_dir, exist_ok=True)
+        img.save(os.path.join(cache_dir, f"{render_key}.png"), format="PNG")
+        _prune_render_cache(cache_dir)
+    except Exception as exc:
+        _log_debug(f"Render cache write failed: {exc}")
 
 def render_latex_image(
     latex_code: str,
@@ -687,8 +1128,14 @@ def render_latex_image(
     add_dt: bool = False,
     status_callback: Optional[Callable[[str], None]] = None
 ) -> Image.Image:
-    has_pdf2image = importlib.util.find_spec("pdf2image") is not None
-    has_pdflatex = _check_pdflatex()
+    wrapped_title, time_str = _header_lines(title, _ticket_time(add_dt))
+    render_key = _latex_render_key(latex_code, wrapped_title, time_str)
+    cached = _load_cached_render(render_key)
+    if cached is not None:
+        return cached
+
+    has_pdf2image = _has_pdf_rasterizer()
+    has_pdflatex = _has_pdflatex()
 
     if has_pdf2image and has_pdflatex:
         try:
@@ -699,27 +1146,19 @@ def render_latex_image(
             if w > max_w:
                 ratio = max_w / w
                 new_h = int(h * ratio)
-                latex_img = latex_img.resize((max_w, new_h), Image.Resampling.LANCZOS)
+                latex_img = latex_img.resize((max_w, new_h), RESAMPLE_LANCZOS)
             
-            header_h = int(MARGIN_T)
-            if title: header_h += 50
-            if add_dt: header_h += 30
+            header_h = int(MARGIN_T + _header_height(wrapped_title, time_str))
             
             final_h = int(header_h + latex_img.size[1] + MARGIN_B)
             final_img = Image.new("L", (int(PRINT_WIDTH_PX), final_h), 255)
             draw = ImageDraw.Draw(final_img)
-            
-            current_y = int(MARGIN_T)
-            if title:
-                draw.text((int(MARGIN_L), current_y), str(title), fill=0, font=FONT_TITLE)
-                current_y += 50
-            if add_dt:
-                dt_str = datetime.now().strftime("%Y-%m-%d %H:%M")
-                draw.text((int(MARGIN_L), current_y), dt_str, fill=0, font=FONT_TIME)
-                current_y += 30
+            current_y = _compose_header(draw, wrapped_title, time_str, int(MARGIN_T))
                 
             x_pos = int((PRINT_WIDTH_PX - latex_img.size[0]) // 2)
             final_img.paste(latex_img, (x_pos, current_y))
+            final_img.info["render_key"] = render_key
+            _store_cached_render(render_key, final_img)
             return final_img
             
         except Exception as e:
@@ -728,19 +1167,36 @@ def render_latex_image(
 
     return render_matplotlib_fallback(latex_code, title, add_dt)
 
+_PYPLOT = None
+
+def _get_pyplot():
+    """Imports matplotlib with the Agg backend once, only when the fallback is needed."""
+    global _PYPLOT
+    if _PYPLOT is None:
+        try:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+        except ImportError:
+            return None
+        _PYPLOT = plt
+    return _PYPLOT
+
+# Rough LaTeX-to-text cleanup for the matplotlib fallback, applied in one pass
+_FALLBACK_CLEANUP_RE = re.compile(
+    r"(?P<section>\\section\*?\{.*?\})"
+    r"|(?P<itemize>\\(?:begin|end)\{itemize\})"
+    r"|(?P<item>\\item)"
+)
+_FALLBACK_REPLACEMENTS = {"section": "\n--- SECTION ---\n", "itemize": "", "item": "\n * "}
+
 def render_matplotlib_fallback(latex_code: str, title: str, add_dt: bool) -> Image.Image:
-    try:
-        import matplotlib
-        import matplotlib.pyplot as plt
-        matplotlib.use('Agg')
-    except ImportError:
+    plt = _get_pyplot()
+    if plt is None:
         return render_receipt_image("Error", ["No LaTeX Engine & no Matplotlib found."], False)
 
     clean_code = latex_code.replace("$$", "$")
-    clean_code = re.sub(r"\\section\*?\{.*?\}", "\n--- SECTION ---\n", clean_code)
-    clean_code = re.sub(r"\\begin\{itemize\}", "", clean_code)
-    clean_code = re.sub(r"\\end\{itemize\}", "", clean_code)
-    clean_code = re.sub(r"\\item", "\n * ", clean_code)
+    clean_code = _FALLBACK_CLEANUP_RE.sub(lambda m: _FALLBACK_REPLACEMENTS[m.lastgroup], clean_code)
     
     line_count = clean_code.count('\n') + 2
     h_inch = max(1.0, line_count * 0.4)
@@ -756,77 +1212,286 @@ def render_matplotlib_fallback(latex_code: str, title: str, add_dt: bool) -> Ima
     img = Image.open(buf).convert("L")
     return render_composed_image(img)
 
+def _open_image_for_print(path: str) -> Image.Image:
+    """Loads an image for printing, JPEGs are decoded grayscale at reduced scale."""
+    with Image.open(path) as im:
+        im.draft("L", (PRINT_WIDTH_PX, 1))
+        return im.copy()
+
 def render_composed_image(source_img: Image.Image) -> Image.Image:
     w, h = source_img.size
     if w != PRINT_WIDTH_PX:
         ratio = PRINT_WIDTH_PX / w
         new_h = int(h * ratio)
-        source_img = source_img.resize((int(PRINT_WIDTH_PX), new_h), Image.Resampling.LANCZOS)
+        source_img = source_img.resize((int(PRINT_WIDTH_PX), new_h), RESAMPLE_LANCZOS)
     return _apply_dither(source_img)
 
 def pil_to_escpos_raster(img: Image.Image) -> bytes:
-    img = img.convert("1")
-    w, h = img.size
-    w_bytes = (w + 7) // 8
-    cmd = b"\x1d\x76\x30\x00" + w_bytes.to_bytes(2, 'little') + h.to_bytes(2, 'little')
-    data = img.tobytes(encoder_name="raw")
-    inverted_data = bytearray()
-    for b in data:
-        inverted_data.append(~b & 0xFF)
-    return cmd + inverted_data
+    # Cached LaTeX renders carry their content hash, reprints reuse the raster
+    render_key = img.info.get("render_key")
+    if render_key is not None:
+        with _RASTER_CACHE_LOCK:
+            cached = _RASTER_CACHE.get(render_key)
+        if cached is not None:
+            return cached
+    if _use_numba_dither(img):
+        # One pass: dither, pack and ESC/POS polarity, no PIL round-trip
+        _, dither_pack = _numba_kernels()
+        packed = dither_pack(np.asarray(img.convert("L")))
+        h, w_bytes = packed.shape
+        inverted_data = packed.tobytes()
+    else:
+        if img.mode != "1":
+            img = img.convert("1")
+        w, h = img.size
+        w_bytes = (w + 7) // 8
+        # PIL stores "1" images with 1 = white, ESC/POS expects 1 = black
+        if np is not None:
+            # Invert before packing so row padding stays white; ~5x faster than tobytes + XOR
+            inverted_data = np.packbits(~np.asarray(img), axis=1).tobytes()
+        else:
+            inverted_data = img.tobytes(encoder_name="raw").translate(_INVERT_TBL)
+    # One GS v 0 command per band keeps each image within the printer's line buffer
+    view = memoryview(inverted_data)
+    parts = []
+    for y in range(0, h, RASTER_BAND_ROWS):
+        rows = min(RASTER_BAND_ROWS, h - y)
+        parts.append(b"\x1d\x76\x30\x00" + w_bytes.to_bytes(2, 'little') + rows.to_bytes(2, 'little'))
+        parts.append(view[y * w_bytes:(y + rows) * w_bytes])
+    raster = b"".join(parts)
+    if render_key is not None:
+        with _RASTER_CACHE_LOCK:
+            _RASTER_CACHE[render_key] = raster
+            while len(_RASTER_CACHE) > RASTER_CACHE_SIZE:
+                _RASTER_CACHE.pop(next(iter(_RASTER_CACHE)))
+    return raster
+
+def _open_printer_socket(ip: str, port: int = PRINTER_PORT) -> socket.socket:
+    sock = socket.create_connection((ip, port), timeout=LAN_TIMEOUT)
+    # Let the init command and first raster chunk go out immediately
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def _send_escpos_job(sock: socket.socket, raster: bytes, cut: bool = True):
+    sock.sendall(b"\x1b@")
+    view = memoryview(raster)
+    for start in range(0, len(view), LAN_CHUNK_SIZE):
+        sock.sendall(view[start:start + LAN_CHUNK_SIZE])
+    sock.sendall(b"\n" * 4 + (b"\x1dV\x00" if cut else b""))
 
 def send_lan_image(img: Image.Image, cut: bool = True) -> bool:
     ip = APP_SETTINGS.get("printer_ip", "")
     if not ip: return False
     try:
-        sock = socket.create_connection((ip, PRINTER_PORT), timeout=LAN_TIMEOUT)
-        commands = b"\x1b@" + pil_to_escpos_raster(img) + b"\n" * 4
-        if cut: commands += b"\x1dV\x00"
-        sock.sendall(commands)
+        raster = pil_to_escpos_raster(img)
+        sock = _open_printer_socket(ip)
+        _send_escpos_job(sock, raster, cut)
         sock.close()
         return True
     except OSError:
         return False
 
+class LanPrinter:
+    """Keeps one TCP connection to the LAN printer open across several jobs."""
+
+    def __init__(self, ip: str, port: int = PRINTER_PORT, idle_timeout: float = LAN_IDLE_TIMEOUT):
+        self.ip = ip
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._idle_timer: Optional[threading.Timer] = None
+        self._last_used = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, img: Image.Image, cut: bool = True, raster: Optional[bytes] = None) -> bool:
+        """Prints img; pass raster if it was already converted (e.g. on a worker thread)."""
+        if not self.ip: return False
+        try:
+            if raster is None:
+                raster = pil_to_escpos_raster(img)
+        except Exception as e:
+            _log_debug(f"LAN raster failed: {e}")
+            return False
+        with self._lock:
+            reused = self.sock is not None
+            try:
+                self._send_locked(raster, cut)
+            except OSError:
+                self._close_locked()
+                if not reused:
+                    return False
+                # The printer may have dropped an idle connection, retry once on a fresh one
+                try:
+                    self._send_locked(raster, cut)
+                except OSError:
+                    self._close_locked()
+                    return False
+            # One timer per idle period rather than per job, it re-arms itself while jobs keep coming
+            self._last_used = time.monotonic()
+            if self._idle_timer is None:
+                self._schedule_idle_close(self.idle_timeout)
+            return True
+
+    def close(self):
+        with self._lock:
+            self._cancel_idle_timer()
+            self._close_locked()
+
+    def _send_locked(self, raster: bytes, cut: bool):
+        if self.sock is None:
+            self.sock = _open_printer_socket(self.ip, self.port)
+        _send_escpos_job(self.sock, raster, cut)
+
+    def _close_locked(self):
+        if self.sock is not None:
+            try: self.sock.close()
+            except OSError: pass
+            self.sock = None
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _schedule_idle_close(self, delay: float):
+        self._idle_timer = threading.Timer(delay, self._close_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _close_if_idle(self):
+        with self._lock:
+            # A timer cancelled by close() may already be waiting on the lock
+            if self._idle_timer is not threading.current_thread(): return
+            self._idle_timer = None
+            if self.sock is None: return
+            remaining = self._last_used + self.idle_timeout - time.monotonic()
+            if remaining > 0:
+                self._schedule_idle_close(remaining)
+            else:
+                self._close_locked()
+
+def _drop_mqtt_client_locked():
+    global _MQTT_CLIENT, _MQTT_CLIENT_CONFIG
+    if _MQTT_CLIENT is not None:
+        # Tickets already reported as sent get a bounded chance to be acknowledged first
+        deadline = time.monotonic() + MQTT_PUBLISH_TIMEOUT
+        for info in _MQTT_PENDING:
+            try:
+                info.wait_for_publish(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                _log_debug(f"MQTT publish not confirmed: {e}")
+        unacked = sum(1 for info in _MQTT_PENDING if not info.is_published())
+        if unacked:
+            _log_debug(f"MQTT: {unacked} ticket(s) unacknowledged at disconnect")
+        try:
+            _MQTT_CLIENT.loop_stop()
+            _MQTT_CLIENT.disconnect()
+        except Exception as e:
+            _log_debug(f"MQTT disconnect failed: {e}")
+    _MQTT_CLIENT = None
+    _MQTT_CLIENT_CONFIG = None
+    _MQTT_PENDING.clear()
+
+def _reset_mqtt_client():
+    """Disconnects the shared MQTT client; the next print reconnects."""
+    with MQTT_LOCK:
+        _drop_mqtt_client_locked()
+
+def wait_mqtt_publishes(timeout: float = MQTT_PUBLISH_TIMEOUT) -> bool:
+    """Blocks until queued MQTT tickets are acknowledged (or timeout). True if all were."""
+    with MQTT_LOCK:
+        pending = list(_MQTT_PENDING)
+    deadline = time.monotonic() + timeout
+    for info in pending:
+        info.wait_for_publish(timeout=max(0.0, deadline - time.monotonic()))
+    with MQTT_LOCK:
+        _MQTT_PENDING[:] = [i for i in _MQTT_PENDING if not i.is_published()]
+        return not _MQTT_PENDING
+
+def _close_mqtt_client():
+    # Dropping the client already waits for outstanding tickets
+    _reset_mqtt_client()
+
+atexit.register(_close_mqtt_client)
+
+def _get_mqtt_client():
+    """Returns a connected MQTT client for the current settings, reused across prints."""
+    global _MQTT_CLIENT, _MQTT_CLIENT_CONFIG
+    import paho.mqtt.client as mqtt
+
+    config = (
+        APP_SETTINGS.get("mqtt_host", ""),
+        APP_SETTINGS.get("mqtt_port", 8883),
+        APP_SETTINGS.get("mqtt_user", ""),
+        APP_SETTINGS.get("mqtt_pass", ""),
+        APP_SETTINGS.get("mqtt_use_tls", True),
+    )
+    with MQTT_LOCK:
+        if _MQTT_CLIENT is not None and _MQTT_CLIENT_CONFIG == config:
+            return _MQTT_CLIENT
+        _drop_mqtt_client_locked()
+
+        host, port, user, pw, use_tls = config
+        client = mqtt.Client(client_id=f"Desk-{uuid.uuid4().hex[:8]}")
+        if use_tls:
+            client.tls_set(cert_reqs=ssl.CERT_REQUIRED)
+        if user:
+            client.username_pw_set(user, pw)
+        client.connect(host, port, keepalive=30)
+        # Background network loop also handles reconnects
+        client.loop_start()
+        _MQTT_CLIENT = client
+        _MQTT_CLIENT_CONFIG = config
+        return client
+
+def _publish_mqtt(payload: bytes) -> bool:
+    """Queues payload on the shared client; the QoS 2 handshake completes in the background."""
+    import paho.mqtt.client as mqtt
+    try:
+        client = _get_mqtt_client()
+        topic = APP_SETTINGS.get("mqtt_topic", "Prn20B1B50C2199")
+        info = client.publish(topic, payload, qos=2)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            _log_debug(f"MQTT publish failed (rc={info.rc}), reconnecting on next print")
+            _reset_mqtt_client()
+            return False
+        # wait_mqtt_publishes() is the barrier (run at exit)
+        with MQTT_LOCK:
+            _MQTT_PENDING[:] = [i for i in _MQTT_PENDING if not i.is_published()]
+            _MQTT_PENDING.append(info)
+        return True
+    except Exception as e:
+        _log_debug(f"MQTT Error: {e}")
+        _reset_mqtt_client()
+        return False
+
 def send_mqtt_image(img: Image.Image, cut: bool = True) -> bool:
     host = APP_SETTINGS.get("mqtt_host", "")
     if not host: return False
     
-    try: import paho.mqtt.client as mqtt
+    try: import paho.mqtt.client
     except ImportError: return False
     
     img_final = _apply_dither(img)
     buf = io.BytesIO()
-    img_final.save(buf, format="PNG")
-    b64_data = base64.b64encode(buf.getvalue()).decode("ascii")
+    # 1-bit tickets compress well even at level 1, higher levels only cost CPU
+    img_final.save(buf, format="PNG", compress_level=MQTT_PNG_COMPRESS_LEVEL, optimize=False)
+    b64_data = base64.b64encode(buf.getbuffer()).decode("ascii")
     
-    client = mqtt.Client(client_id=f"Desk-{uuid.uuid4().hex[:8]}")
-    
-    if APP_SETTINGS.get("mqtt_use_tls", True):
-        client.tls_set(cert_reqs=ssl.CERT_REQUIRED)
-        
-    user = APP_SETTINGS.get("mqtt_user", "")
-    pw = APP_SETTINGS.get("mqtt_pass", "")
-    if user:
-        client.username_pw_set(user, pw)
-        
-    try:
-        client.connect(host, APP_SETTINGS.get("mqtt_port", 8883), keepalive=30)
-        payload = {
-            "ticket_id": f"desk-{int(datetime.now().timestamp())}",
-            "data_type": "png",
-            "data_base64": b64_data,
-            "cut_paper": 1 if cut else 0,
-            "source": "Modern_Desktop"
-        }
-        topic = APP_SETTINGS.get("mqtt_topic", "Prn20B1B50C2199")
-        client.publish(topic, json.dumps(payload), qos=2)
-        client.loop(timeout=2.0)
-        client.disconnect()
-        return True
-    except Exception as e:
-        _log_debug(f"MQTT Error: {e}")
-        return False
+    payload = {
+        "ticket_id": f"desk-{int(datetime.now().timestamp())}",
+        "data_type": "png",
+        "cut_paper": 1 if cut else 0,
+        "source": "Modern_Desktop",
+        "data_base64": b64_data
+    }
+    return _publish_mqtt(json.dumps(payload).encode("utf-8"))
 
 def send_manual_cut() -> bool:
     if send_lan_image(Image.new("1", (1,1)), cut=True): 
@@ -834,32 +1499,48 @@ def send_manual_cut() -> bool:
     host = APP_SETTINGS.get("mqtt_host", "")
     if not host: return False
 
-    try:
-        import paho.mqtt.client as mqtt
-        client = mqtt.Client(client_id=f"Cut-{uuid.uuid4().hex[:8]}")
-        if APP_SETTINGS.get("mqtt_use_tls", True):
-            client.tls_set(cert_reqs=ssl.CERT_REQUIRED)
-        user = APP_SETTINGS.get("mqtt_user", "")
-        pw = APP_SETTINGS.get("mqtt_pass", "")
-        if user: client.username_pw_set(user, pw)
-            
-        client.connect(host, APP_SETTINGS.get("mqtt_port", 8883), keepalive=30)
-        payload = {"ticket_id": "cut-only", "data_type": "cmd", "cut_paper": 1}
-        topic = APP_SETTINGS.get("mqtt_topic", "Prn20B1B50C2199")
-        client.publish(topic, json.dumps(payload), qos=2)
-        client.loop(timeout=2.0)
-        client.disconnect()
-        return True
-    except: return False
+    try: import paho.mqtt.client
+    except ImportError: return False
 
-def print_master(img: Image.Image, cut: bool = True) -> str:
-    res_lan = send_lan_image(img, cut)
-    if res_lan: return "OK (LAN)"
+    payload = {"ticket_id": "cut-only", "data_type": "cmd", "cut_paper": 1}
+    return _publish_mqtt(json.dumps(payload).encode("utf-8"))
+
+class PrintResult(str, enum.Enum):
+    """Outcome of print_master; the value doubles as the status bar text."""
+    LAN = "OK (LAN)"
+    CLOUD = "OK (Cloud)"
+    FAILED = "Failed (Check Settings)"
+
+    def __str__(self):
+        return self.value
+
+    @property
+    def ok(self) -> bool:
+        return self is not PrintResult.FAILED
+
+def print_master(
+    img: Image.Image,
+    cut: bool = True,
+    lan: Optional[LanPrinter] = None,
+    raster: Optional[bytes] = None
+) -> PrintResult:
+    res_lan = lan.send(img, cut, raster) if lan is not None else send_lan_image(img, cut)
+    if res_lan: return PrintResult.LAN
     
     res_mqtt = send_mqtt_image(img, cut)
-    if res_mqtt: return "OK (Cloud)"
+    if res_mqtt: return PrintResult.CLOUD
     
-    return "Failed (Check Settings)"
+    return PrintResult.FAILED
+
+def print_master_batch(images: List[Image.Image], cut_last_only: bool = True) -> int:
+    """Prints several images over one connection, returns how many were printed."""
+    count = 0
+    last = len(images) - 1
+    with LanPrinter(APP_SETTINGS.get("printer_ip", "")) as lan:
+        for i, img in enumerate(images):
+            cut = i == last or not cut_last_only
+            if print_master(img, cut, lan=lan).ok: count += 1
+    return count
 
 # ----------------------------------------------------------------------
 # MODERN GUI (CustomTkinter)
@@ -873,6 +1554,8 @@ class ModernPrinterApp(ctk.CTk):
         self.font_main = (APP_SETTINGS["font_family"], 13)
         self.font_head = (APP_SETTINGS["font_family"], 20, "bold")
         self.font_mono = ("Consolas", 12)
+        # Shared by all settings field labels, resolved by Tk once
+        self.font_label = ctk.CTkFont(family="Arial", size=12, weight="bold")
         self.title("Universal Ticket Printer")
         
         try:
@@ -914,8 +1597,18 @@ class ModernPrinterApp(ctk.CTk):
         self.main_container.grid_rowconfigure(0, weight=1)
         self.main_container.grid_columnconfigure(0, weight=1)
         
-        self.selected_images = []
+        # Insertion-ordered set of paths (dict keys), O(1) membership and removal
+        self.selected_images: Dict[str, None] = {}
+        self._thumb_cache: Dict[str, ctk.CTkImage] = {}
+        self._thumb_pending: Set[str] = set()
+        self._thumb_futures: Set[Future] = set()
+        self._thumb_broken: Set[str] = set()
+        self._thumb_widgets: Dict[str, ctk.CTkFrame] = {}
         self.frames = {}
+        # Shared by prints, previews and status checks; also bounds concurrent printer sockets
+        self._bg_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ticket")
+        self._closing = False
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
         self.latest_latex_preview = None
         self.latest_latex_source = None
         
@@ -942,12 +1635,18 @@ class ModernPrinterApp(ctk.CTk):
 
     def _warmup_manifest_async(self):
         def _task():
-            _warmup_manifest()
+            # Steps are independent, one failing optional dependency must not skip the others
+            for step in (_warmup_numba, _warmup_manifest, _build_latex_format):
+                try:
+                    step()
+                except Exception as exc:
+                    _log_debug(f"Warm-up step {step.__name__} failed: {exc}")
+        # Own daemon thread: package warmup can take minutes and must not hold up exit
         threading.Thread(target=_task, daemon=True).start()
 
     def _show_setup_warning(self):
         miktex_msg = ""
-        if not _check_pdflatex():
+        if not _has_pdflatex():
             miktex_msg = (
                 "\n\nWARNING: MiKTeX (LaTeX) was not found!\n"
                 "To print math/physics formulas, you must install MiKTeX.\n"
@@ -974,7 +1673,7 @@ class ModernPrinterApp(ctk.CTk):
                 _log_debug(f"Update Check failed: {e}")
 
         if 'requests' in sys.modules:
-            threading.Thread(target=_check, daemon=True).start()
+            self._bg_pool.submit(_check)
 
     def _show_update_dialog(self, new_ver):
         is_preview = "preview" in APP_VERSION.lower()
@@ -1029,12 +1728,12 @@ class ModernPrinterApp(ctk.CTk):
         try:
             temp_dir = tempfile.mkdtemp()
             installer_path = os.path.join(temp_dir, setup_asset.get("name", f"TicketPrinter_Update_{new_ver}.exe"))
-            with requests.get(download_url, stream=True, timeout=30) as dl:
+            # Installer is already compressed, ask for it as-is and copy the raw stream
+            with requests.get(download_url, stream=True, timeout=30, headers={"Accept-Encoding": "identity"}) as dl:
                 dl.raise_for_status()
+                dl.raw.decode_content = True
                 with open(installer_path, "wb") as f:
-                    for chunk in dl.iter_content(chunk_size=1024 * 1024):
-                        if chunk:
-                            f.write(chunk)
+                    shutil.copyfileobj(dl.raw, f, length=1024 * 1024)
         except Exception as e:
             return f"Update failed: {e}"
 
@@ -1054,8 +1753,10 @@ class ModernPrinterApp(ctk.CTk):
 
     def _check_latex_tools_async(self):
         def _check():
-            has_latex = _check_pdflatex()
-            has_pdf2image = importlib.util.find_spec("pdf2image") is not None
+            # Runs whenever the LaTeX tab is opened, so tools installed meanwhile are picked up
+            _invalidate_dep_cache()
+            has_latex = _has_pdflatex()
+            has_pdf2image = _has_pdf_rasterizer()
             if not has_latex:
                 status_txt = "⚠️ Error: MiKTeX missing (Download required!)"
                 color = "red"
@@ -1066,7 +1767,7 @@ class ModernPrinterApp(ctk.CTk):
                 status_txt = "✅ LaTeX Engine Ready"
                 color = "gray"
             self.after(0, lambda: self.lbl_tools.configure(text=status_txt, text_color=color))
-        threading.Thread(target=_check, daemon=True).start()
+        self._bg_pool.submit(_check)
 
     def _select_nav(self, btn):
         for b in [self.btn_bulk, self.btn_tpl, self.btn_raw, self.btn_imgs, self.btn_settings, self.btn_latex]:
@@ -1103,18 +1804,25 @@ class ModernPrinterApp(ctk.CTk):
                 self.after(0, lambda: on_success(img))
             except Exception as exc:
                 self.after(0, lambda: on_error(exc))
-        threading.Thread(target=_task, daemon=True).start()
+        self._bg_pool.submit(_task)
 
     def _bg_task(self, task_func):
         def wrapper():
             self._update_status("Processing...")
             try:
                 res = task_func()
-                self._update_status(res)
+                self._update_status(str(res))
             except Exception as e:
                 _log_debug(f"BG Task Error: {e}")
                 self._update_status("Error occurred.")
-        threading.Thread(target=wrapper, daemon=True).start()
+        self._bg_pool.submit(wrapper)
+
+    def _on_close(self):
+        self._closing = True
+        self._bg_pool.shutdown(wait=False, cancel_futures=True)
+        # RENDER_POOL is shared, so only this window's queued thumbnails are cancelled
+        for fut in list(self._thumb_futures): fut.cancel()
+        self.destroy()
 
     def do_manual_cut(self):
         self._bg_task(lambda: "Cut: OK" if send_manual_cut() else "Cut: Error")
@@ -1147,14 +1855,31 @@ class ModernPrinterApp(ctk.CTk):
         def task():
             count = 0
             lines = raw.splitlines()
+            jobs = []
             for ln in lines:
-                if not ln.strip(): continue
-                if delimiter in ln:
-                    t, b = ln.split(delimiter, 1)
-                    img = render_receipt_image(t.strip(), [b.strip()], use_dt)
+                stripped = ln.strip()
+                if not stripped: continue
+                # Partition the raw line, a whitespace delimiter such as tab must survive
+                t, sep, b = ln.partition(delimiter)
+                if sep:
+                    jobs.append((t.strip(), (b.strip(),)))
                 else:
-                    img = render_receipt_image(ln.strip(), [""], use_dt)
-                if "OK" in print_master(img, cut=do_cut): count += 1
+                    jobs.append((stripped, ("",)))
+            # Render and rasterize ahead on the pool while tickets are sent one by one, in order
+            time_str = _ticket_time(use_dt)
+            with LanPrinter(APP_SETTINGS.get("printer_ip", "")) as lan:
+                def render(t, body):
+                    img = _render_bulk_ticket(t, body, time_str)
+                    return img, (pil_to_escpos_raster(img) if lan.ip else None)
+                # Only a small window is rendered ahead, so long pastes don't pile up images
+                pending_jobs = iter(jobs)
+                in_flight = deque(RENDER_POOL.submit(render, t, body) for t, body in islice(pending_jobs, BULK_READ_AHEAD))
+                while in_flight:
+                    img, raster = in_flight.popleft().result()
+                    nxt = next(pending_jobs, None)
+                    if nxt is not None:
+                        in_flight.append(RENDER_POOL.submit(render, *nxt))
+                    if print_master(img, cut=do_cut, lan=lan, raster=raster).ok: count += 1
             return f"Bulk: {count}/{len(lines)} printed"
         self._bg_task(task)
 
@@ -1186,7 +1911,7 @@ class ModernPrinterApp(ctk.CTk):
         self.display_preview(img, self.tpl_preview_lbl)
 
     def do_tpl_print(self):
-        img = render_receipt_image(self.tpl_title.get(), self.tpl_body.get("1.0", "end").strip().splitlines(), self.tpl_dt.get())
+        img = render_receipt_image_mono(self.tpl_title.get(), self.tpl_body.get("1.0", "end").strip().splitlines(), self.tpl_dt.get())
         self._bg_task(lambda: print_master(img, True))
 
     def _init_raw_frame(self):
@@ -1204,7 +1929,7 @@ class ModernPrinterApp(ctk.CTk):
         self._switch_frame("raw")
 
     def do_raw_print(self):
-        img = render_receipt_image("", self.raw_txt.get("1.0", "end").strip().splitlines(), self.raw_dt.get())
+        img = render_receipt_image_mono("", self.raw_txt.get("1.0", "end").strip().splitlines(), self.raw_dt.get())
         self._bg_task(lambda: print_master(img, True))
 
     def _init_latex_frame(self):
@@ -1234,11 +1959,12 @@ class ModernPrinterApp(ctk.CTk):
         self.scroll_preview.pack(fill="both", expand=True)
         self.lbl_latex_preview = ctk.CTkLabel(self.scroll_preview, text="Preview here...", text_color="gray")
         self.lbl_latex_preview.pack(pady=20, padx=20)
-        self._check_latex_tools_async()
 
     def show_latex(self):
         self._select_nav(self.btn_latex)
         self._switch_frame("latex")
+        # Re-checked on every visit, a passing pdflatex is remembered so this is cheap
+        self._check_latex_tools_async()
 
     def do_latex_preview(self):
         self.lbl_latex_preview.configure(image=None, text="Rendering...")
@@ -1282,10 +2008,11 @@ class ModernPrinterApp(ctk.CTk):
         return self.latex_input.get("1.0", "end").strip()
 
     def display_preview(self, pil_img, label_widget, max_height: int = 600):
-        display_img = pil_img.copy()
+        # resize() already returns a new image and nothing mutates the preview, so no copy
+        display_img = pil_img
         if display_img.height > max_height:
             ratio = max_height / display_img.height
-            display_img = display_img.resize((int(display_img.width * ratio), max_height))
+            display_img = display_img.resize((int(display_img.width * ratio), max_height), reducing_gap=RESIZE_REDUCING_GAP)
         ctk_img = ctk.CTkImage(light_image=display_img, dark_image=display_img, size=display_img.size)
         label_widget.configure(image=ctk_img, text="")
         label_widget.image = ctk_img 
@@ -1316,17 +2043,42 @@ class ModernPrinterApp(ctk.CTk):
         img_label = ctk.CTkLabel(container, text="")
         img_label.pack(pady=10, padx=10)
 
+        @lru_cache(maxsize=ZOOM_CACHE_SIZE)
+        def scaled_image(scale: float) -> ctk.CTkImage:
+            target = (int(pil_img.width * scale), int(pil_img.height * scale))
+            if scale < 1.0:
+                scaled = pil_img.resize(target, RESAMPLE_LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+            else:
+                # Zooming in gains nothing from LANCZOS but costs more per slider tick
+                scaled = pil_img.resize(target, RESAMPLE_BICUBIC)
+            return ctk.CTkImage(light_image=scaled, dark_image=scaled, size=scaled.size)
+
         def render_scaled_image(*_):
-            scale = scale_var.get()
-            scaled = pil_img.resize((int(pil_img.width * scale), int(pil_img.height * scale)), Image.Resampling.LANCZOS)
-            ctk_img = ctk.CTkImage(light_image=scaled, dark_image=scaled, size=scaled.size)
+            # Slider steps are 0.05 apart, rounding makes revisited zoom levels hit the cache
+            ctk_img = scaled_image(round(scale_var.get(), 2))
             img_label.configure(image=ctk_img, text="")
             img_label.image = ctk_img
 
-        scale_var.trace_add("write", render_scaled_image)
+        zoom_after_id = None
+
+        def schedule_render(*_):
+            # Slider drags write every intermediate step, only the last one is rendered
+            nonlocal zoom_after_id
+            if zoom_after_id is not None:
+                fullscreen.after_cancel(zoom_after_id)
+            zoom_after_id = fullscreen.after(ZOOM_DEBOUNCE_MS, debounced_render)
+
+        def debounced_render():
+            nonlocal zoom_after_id
+            zoom_after_id = None
+            if fullscreen.winfo_exists():
+                render_scaled_image()
+
+        scale_var.trace_add("write", schedule_render)
         render_scaled_image()
 
         fullscreen.bind("<Escape>", lambda event: fullscreen.destroy())
+        fullscreen.bind("<Destroy>", lambda event: scaled_image.cache_clear() if event.widget is fullscreen else None)
 
     def _init_image_frame(self):
         f = ctk.CTkFrame(self.main_container, fg_color="transparent")
@@ -1347,37 +2099,91 @@ class ModernPrinterApp(ctk.CTk):
     def add_images(self):
         paths = filedialog.askopenfilenames(filetypes=[("Images", "*.png;*.jpg;*.jpeg")])
         if paths:
-            self.selected_images.extend([p for p in paths if p not in self.selected_images])
+            self.selected_images.update(dict.fromkeys(paths))
             self._redraw_thumbs()
 
     def clear_images(self):
         self.selected_images.clear()
-        self._redraw_thumbs()
+        self._thumb_cache.clear()
+        self._thumb_broken.clear()
+        for card in self._thumb_widgets.values(): card.destroy()
+        self._thumb_widgets.clear()
+
+    def remove_image(self, path: str):
+        self.selected_images.pop(path, None)
+        self._thumb_cache.pop(path, None)
+        self._thumb_broken.discard(path)
+        card = self._thumb_widgets.pop(path, None)
+        if card is not None: card.destroy()
+        self._reflow_thumbs()
+
+    def _load_thumb_async(self, path: str):
+        """Decodes a thumbnail on the render pool and redraws once it is cached."""
+        if path in self._thumb_pending or path in self._thumb_broken: return
+        self._thumb_pending.add(path)
+        def _load():
+            # thumbnail() already lets the JPEG decoder downscale via draft()
+            with Image.open(path) as p_img:
+                p_img.thumbnail((150, 150))
+                return p_img.copy()
+        def _done(fut):
+            def _apply():
+                self._thumb_pending.discard(path)
+                self._thumb_futures.discard(fut)
+                if fut.exception() is not None:
+                    # Remember unreadable files so later redraws don't decode them again
+                    _log_debug(f"Thumbnail failed for {path}: {fut.exception()}")
+                    self._thumb_broken.add(path)
+                    return
+                if path not in self.selected_images: return
+                p_img = fut.result()
+                self._thumb_cache[path] = ctk.CTkImage(light_image=p_img, dark_image=p_img, size=p_img.size)
+                self._redraw_thumbs()
+            # Tk calls are unsafe from the pool, so the close flag stands in for winfo_exists()
+            if self._closing: return
+            try:
+                self.after(0, _apply)
+            except (RuntimeError, tk.TclError):
+                pass # window closed between the check and the call
+        fut = RENDER_POOL.submit(_load)
+        self._thumb_futures.add(fut)
+        fut.add_done_callback(_done)
 
     def _redraw_thumbs(self):
-        for w in self.scroll_imgs.winfo_children(): w.destroy()
+        """Creates cards for newly loaded thumbnails, existing cards are kept."""
+        for path in self.selected_images:
+            if path in self._thumb_widgets: continue
+            ctk_img = self._thumb_cache.get(path)
+            if ctk_img is None:
+                self._load_thumb_async(path)
+                continue
+            card = ctk.CTkFrame(self.scroll_imgs, corner_radius=10)
+            ctk.CTkLabel(card, text="", image=ctk_img).pack(padx=10, pady=10)
+            ctk.CTkButton(card, text="Delete", fg_color="#c0392b", height=20, command=lambda p=path: self.remove_image(p)).pack(pady=5)
+            self._thumb_widgets[path] = card
+        self._reflow_thumbs()
+
+    def _reflow_thumbs(self):
+        """Re-grids the existing cards in selection order."""
         r, c = 0, 0
         for path in self.selected_images:
-            try:
-                p_img = Image.open(path)
-                p_img.thumbnail((150, 150))
-                ctk_img = ctk.CTkImage(light_image=p_img, dark_image=p_img, size=p_img.size)
-                card = ctk.CTkFrame(self.scroll_imgs, corner_radius=10)
-                card.grid(row=r, column=c, padx=10, pady=10)
-                ctk.CTkLabel(card, text="", image=ctk_img).pack(padx=10, pady=10)
-                ctk.CTkButton(card, text="Delete", fg_color="#c0392b", height=20, command=lambda p=path: (self.selected_images.remove(p), self._redraw_thumbs())).pack(pady=5)
-                c += 1
-                if c >= 3: c, r = 0, r + 1
-            except: pass
+            card = self._thumb_widgets.get(path)
+            if card is None: continue
+            card.grid(row=r, column=c, padx=10, pady=10)
+            c += 1
+            if c >= 3: c, r = 0, r + 1
 
     def do_img_print(self):
         imgs = list(self.selected_images)
+        def render(p):
+            try:
+                return render_composed_image(_open_image_for_print(p))
+            except Exception as e:
+                _log_debug(f"Image print skipped {p}: {e}")
+                return None
         def task():
-            count = 0
-            for p in imgs:
-                try:
-                    if "OK" in print_master(render_composed_image(Image.open(p)), True): count += 1
-                except: pass
+            rendered = [img for img in RENDER_POOL.map(render, imgs) if img is not None]
+            count = print_master_batch(rendered, cut_last_only=True)
             return f"{count} images printed"
         self._bg_task(task)
 
@@ -1394,27 +2200,27 @@ class ModernPrinterApp(ctk.CTk):
         # UI Settings
         b1 = ctk.CTkFrame(scroll, corner_radius=10)
         b1.pack(fill="x", pady=5, ipady=5)
-        ctk.CTkLabel(b1, text="Delimiter (Bulk):", font=("Arial", 12, "bold")).pack(anchor="w", padx=15, pady=5)
-        self.entry_delim = ctk.CTkEntry(b1)
-        self.entry_delim.insert(0, APP_SETTINGS.get("bulk_delimiter", "::"))
-        self.entry_delim.pack(fill="x", padx=15, pady=(0, 10))
+        ctk.CTkLabel(b1, text="Delimiter (Bulk):", font=self.font_label).pack(anchor="w", padx=15, pady=5)
+        # One StringVar per setting, read back in save_all_settings
+        self._setting_vars: Dict[str, tk.StringVar] = {}
+        self._setting_vars["bulk_delimiter"] = tk.StringVar(self, APP_SETTINGS.get("bulk_delimiter", "::"))
+        ctk.CTkEntry(b1, textvariable=self._setting_vars["bulk_delimiter"]).pack(fill="x", padx=15, pady=(0, 10))
         
         # Printer Settings (IP)
         ctk.CTkLabel(scroll, text="Local Printer (LAN)", font=self.font_head).pack(anchor="w", pady=(20, 10))
         b_prn = ctk.CTkFrame(scroll, corner_radius=10)
         b_prn.pack(fill="x", pady=5, ipady=5)
         
-        ctk.CTkLabel(b_prn, text="Printer IP Address:", font=("Arial", 12, "bold")).pack(anchor="w", padx=15, pady=5)
-        self.entry_ip = ctk.CTkEntry(b_prn, placeholder_text="e.g. 192.168.1.132")
-        self.entry_ip.insert(0, APP_SETTINGS.get("printer_ip", ""))
-        self.entry_ip.pack(fill="x", padx=15, pady=(0, 10))
+        # CTkEntry hides placeholders when bound to a variable, so the example lives in the label
+        ctk.CTkLabel(b_prn, text="Printer IP Address (e.g. 192.168.1.132):", font=self.font_label).pack(anchor="w", padx=15, pady=5)
+        self._setting_vars["printer_ip"] = tk.StringVar(self, APP_SETTINGS.get("printer_ip", ""))
+        ctk.CTkEntry(b_prn, textvariable=self._setting_vars["printer_ip"]).pack(fill="x", padx=15, pady=(0, 10))
 
         # Cloud Settings (MQTT)
         ctk.CTkLabel(scroll, text="Cloud Printing (MQTT)", font=self.font_head).pack(anchor="w", pady=(20, 10))
         b_mqtt = ctk.CTkFrame(scroll, corner_radius=10)
         b_mqtt.pack(fill="x", pady=5, ipady=5)
 
-        self.mqtt_entries = {}
         fields = [
             ("Host", "mqtt_host"),
             ("Port", "mqtt_port"),
@@ -1424,13 +2230,13 @@ class ModernPrinterApp(ctk.CTk):
         ]
         
         for label, key in fields:
-            ctk.CTkLabel(b_mqtt, text=label+":", font=("Arial", 12, "bold")).pack(anchor="w", padx=15, pady=(5,0))
-            ent = ctk.CTkEntry(b_mqtt)
+            ctk.CTkLabel(b_mqtt, text=label+":", font=self.font_label).pack(anchor="w", padx=15, pady=(5,0))
             val = APP_SETTINGS.get(key, "")
-            if val is not None: ent.insert(0, str(val))
+            var = tk.StringVar(self, "" if val is None else str(val))
+            ent = ctk.CTkEntry(b_mqtt, textvariable=var)
             if key == "mqtt_pass": ent.configure(show="*")
             ent.pack(fill="x", padx=15, pady=(0, 5))
-            self.mqtt_entries[key] = ent
+            self._setting_vars[key] = var
 
         ctk.CTkButton(scroll, text="Save & Restart", command=self.save_all_settings, fg_color="green", height=50).pack(fill="x", pady=30)
 
@@ -1439,20 +2245,13 @@ class ModernPrinterApp(ctk.CTk):
         self._switch_frame("settings")
 
     def save_all_settings(self):
-        new_data = {
-            "bulk_delimiter": self.entry_delim.get(),
-            "printer_ip": self.entry_ip.get().strip(),
-            "mqtt_host": self.mqtt_entries["mqtt_host"].get().strip(),
-            "mqtt_port": int(self.mqtt_entries["mqtt_port"].get().strip() or 8883),
-            "mqtt_user": self.mqtt_entries["mqtt_user"].get().strip(),
-            "mqtt_pass": self.mqtt_entries["mqtt_pass"].get().strip(),
-            "mqtt_topic": self.mqtt_entries["mqtt_topic"].get().strip(),
-        }
+        new_data = {k: v.get().strip() for k, v in self._setting_vars.items()}
+        # The delimiter may legitimately contain surrounding spaces
+        new_data["bulk_delimiter"] = self._setting_vars["bulk_delimiter"].get()
+        new_data["mqtt_port"] = int(new_data["mqtt_port"] or 8883)
         
         save_settings(new_data)
         messagebox.showinfo("Saved", "Settings saved. Please restart app if UI doesn't update.")
-        global APP_SETTINGS
-        APP_SETTINGS.update(new_data)
 
 if __name__ == "__main__":
     ensure_admin_on_first_run()